@@ -1,4 +1,7 @@
 import os
+import re
+import hashlib
+import atexit
 import sys
 import copy
 import time
@@ -6,23 +9,31 @@ import random
 import pyspark
 import all_states
 import math
+import numpy as np
+import clustering
+import itemsets
+import disk_cache
+import encoding
+import streaming
+import instrumentation
+from instrumentation import instrumented
+from state_vectors import StateVectors
+from collections import OrderedDict
 from statistics import mean
 from pyspark.rdd import RDD
-from pyspark.sql import Row
 from pyspark.sql import DataFrame
 from pyspark.sql import SparkSession
 from pyspark.ml.fpm import FPGrowth
 from pyspark.sql.functions import desc, size, max, abs
 from pyspark.sql.functions import monotonically_increasing_id
-from pyspark.sql.functions import lit
-from pyspark.sql.functions import array_contains,array
-from pyspark import SparkContext
-sc = SparkContext()
+from pyspark.sql.functions import lit, array, spark_partition_id
+from pyspark.sql.functions import col, expr, split, explode, collect_set
+from pyspark.sql.functions import create_map
+from pyspark.sql.functions import broadcast, collect_list, explode_outer
+from pyspark import StorageLevel
 
 states=all_states.all_states
 all_plants=None
-data_f=None
-data_df=None
 data_points_index=None
 MAX_FLOAT_VALUE = sys.float_info.max
 '''
@@ -55,32 +66,109 @@ These functions are here to help you. Instructions will tell you when
 you should use them. Don't modify them!
 '''
 
+'''
+SPARK SESSION
+
+The Spark session (and its JVM) is only started by the first function 
+that needs it, and then reused by all the others: importing this 
+module or calling a function that doesn't use Spark is cheap. 
+SPARK_CONFIG holds the settings applied when the session starts; 
+configure_spark changes them and stop_spark stops the session.
+'''
+
+SPARK_CONFIG = {
+    "spark.sql.shuffle.partitions": str(2 * (os.cpu_count() or 1)),
+    "spark.sql.execution.arrow.enabled": "true",
+    "spark.sql.execution.arrow.pyspark.enabled": "true",
+    "spark.serializer": "org.apache.spark.serializer.KryoSerializer",
+}
+spark_session = None
+
 def init_spark():
-    spark = SparkSession \
-        .builder \
-        .appName("Python Spark SQL basic example") \
-        .config("spark.some.config.option", "some-value") \
-        .getOrCreate()
-    return spark
+    global spark_session
+    if spark_session is None:
+        builder = SparkSession.builder.appName("Clustering and Frequent Itemsets")
+        for key, value in SPARK_CONFIG.items():
+            builder = builder.config(key, value)
+        spark_session = builder.getOrCreate()
+    return spark_session
+
+def spark_context():
+    return init_spark().sparkContext
+
+def active_spark_context():
+    return None if spark_session is None else spark_session.sparkContext
+
+def configure_spark(config):
+    '''
+    Updates SPARK_CONFIG with the dictionary <config>. The settings are 
+    applied by the next session started, so the current one, if any, 
+    is stopped.
+    '''
+    SPARK_CONFIG.update(config)
+    stop_spark()
+
+def stop_spark():
+    '''
+    Stops the Spark session, if it was started, and drops the cached 
+    DataFrames and RDDs that depend on it.
+    '''
+    global spark_session
+    if spark_session is None:
+        return
+    baskets_cache.clear()
+    encoded_cache.clear()
+    model_cache.clear()
+    points_cache.clear()
+    spark_session.stop()
+    spark_session = None
+
+atexit.register(stop_spark)
 
 def toCSVLineRDD(rdd):
-    a = rdd.map(lambda row: ",".join([str(elt) for elt in row]))\
-           .reduce(lambda x,y: os.linesep.join([x,y]))
-    return a + os.linesep
+    return "".join(toCSVLineIterator(rdd))
 
 def toCSVLine(data):
-    if isinstance(data, RDD):
-        if data.count() > 0:
-            return toCSVLineRDD(data)
-        else:
-            return ""
-    elif isinstance(data, DataFrame):
-        if data.count() > 0:
-            return toCSVLineRDD(data.rdd)
-        else:
-            return ""
+    if isinstance(data, RDD) or isinstance(data, DataFrame) or isinstance(data, list):
+        return "".join(toCSVLineIterator(data))
     return None
 
+def toCSVLineIterator(data):
+    '''
+    Yields the CSV lines of an RDD, a DataFrame or a list of rows, each 
+    one terminated by os.linesep. Rows are fetched one partition at a 
+    time, in order, so the driver never holds more than one partition.
+    '''
+    rows = data if isinstance(data, list) else data.toLocalIterator()
+    for row in rows:
+        yield ",".join([str(elt) for elt in row]) + os.linesep
+
+def writeCSV(data, output):
+    '''
+    Writes the CSV lines of an RDD or DataFrame to <output>, a file 
+    name or a file-like object, partition by partition.
+
+    Return value: the number of lines written.
+    '''
+    if isinstance(output, str):
+        with open(output, "w", newline="") as f:
+            return writeCSV(data, f)
+    count = 0
+    for line in toCSVLineIterator(data):
+        output.write(line)
+        count += 1
+    return count
+
+'''
+INSTRUMENTATION
+
+The pipeline stages of Part 1 and Part 2 are decorated with 
+@instrumented. After instrumentation.enable(), every call records the 
+time, Spark jobs, rows and cache hits of its stages, available from 
+instrumentation.report().
+'''
+
+instrumentation.set_spark_context(active_spark_context)
 
 '''
 PART 1: FREQUENT ITEMSETS
@@ -95,6 +183,233 @@ scope to show how frequent itemset mining can be used in a variety of
 contexts.
 '''
 
+'''
+BASKET DATASET
+
+All the Part 1 functions work on the same DataFrame of baskets. It is 
+parsed once per (path, modification time) and persisted, so that 
+running several queries on the same file doesn't parse it again.
+
+When DISK_CACHE is True, the parsed data is also written next to the 
+data file (see the disk_cache module): the baskets as Parquet and the 
+state vectors as a packed bit matrix. Other processes then open these 
+files instead of parsing the text again.
+'''
+
+DISK_CACHE = True
+
+def cache_directory(filename):
+    if not DISK_CACHE:
+        return None
+    return disk_cache.cache_directory(os.path.abspath(filename))
+
+baskets_cache = {}
+
+def dataset_key(filename):
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+@instrumented
+def load_baskets(filename):
+    '''
+    Returns a DataFrame with columns <id> (line number - 1), <plant> 
+    and <items> (array of states, ordered as in the data file), parsed 
+    from <filename>. The DataFrame is persisted in memory (spilling to 
+    disk) and reused until the file changes or invalidate_baskets is 
+    called.
+    '''
+    key = dataset_key(filename)
+    cached = baskets_cache.get(key[0])
+    instrumentation.cache("baskets", cached is not None and cached[0] == key)
+    if cached is not None:
+        if cached[0] == key:
+            return cached[1]
+        cached[1].unpersist()
+    spark = init_spark()
+    directory = cache_directory(filename)
+    parquet = None if directory is None else os.path.join(directory, "baskets.parquet")
+    parsed = parquet is not None and os.path.exists(os.path.join(parquet, "_SUCCESS"))
+    instrumentation.cache("parquet", parsed)
+    if parsed:
+        df = spark.read.parquet(parquet)
+        parquet = None
+    else:
+        parts = split(col("value"), ",")
+        lines = spark.read.text(key[0]) \
+                     .select(spark_partition_id().alias("partition"),
+                             monotonically_increasing_id().alias("position"),
+                             parts.alias("parts"))
+        df = lines.select(line_numbers(lines).alias("id"),
+                          col("parts")[0].alias("plant"),
+                          expr("slice(parts, 2, size(parts) - 1)").alias("items"))
+    df.persist(StorageLevel.MEMORY_AND_DISK)
+    if parquet is not None:
+        df.write.mode("overwrite").parquet(parquet)
+    baskets_cache[key[0]] = (key, df)
+    return df
+
+def line_numbers(lines):
+    '''
+    Returns the column of the line numbers - 1 of the DataFrame <lines> 
+    read from a text file, with the columns <partition> 
+    (spark_partition_id) and <position> (monotonically_increasing_id). 
+    The ids of monotonically_increasing_id start at partition index x 
+    2^33 in every partition, so the lines of every partition are 
+    counted (one job) to shift them after the lines of the previous 
+    partitions.
+    '''
+    counts = dict(lines.groupBy("partition").count().collect())
+    offsets = []
+    total = 0
+    for partition in range(lines.rdd.getNumPartitions()):
+        offsets.append(total - (partition << 33))
+        total += counts.get(partition, 0)
+    return col("position") + array(*[lit(offset) for offset in offsets or [0]])[col("partition")]
+
+basket_counts = {}
+
+@instrumented
+def basket_count(filename):
+    '''
+    Returns the number of baskets of <filename>. It is counted once per 
+    version of the file, which also materializes the persisted 
+    DataFrame.
+    '''
+    key = dataset_key(filename)
+    instrumentation.cache("basket_counts", key in basket_counts)
+    if key not in basket_counts:
+        basket_counts[key] = load_baskets(filename).count()
+    return basket_counts[key]
+
+encodings = {}
+
+@instrumented
+def item_encoding(filename):
+    '''
+    Returns the Encoding of the states of all_states and of the items 
+    found in <filename>.
+    '''
+    key = dataset_key(filename)
+    instrumentation.cache("encodings", key in encodings)
+    if key not in encodings:
+        df = load_baskets(filename)
+        items = df.select(explode(df.items)).distinct().rdd.flatMap(lambda x: x).collect()
+        encodings[key] = encoding.item_encoding(items)
+    return encodings[key]
+
+encoded_cache = {}
+
+@instrumented
+def encoded_baskets(filename):
+    '''
+    Returns the persisted DataFrame of baskets of <filename> with the 
+    columns <id> and <item_ids>: the items encoded as an array of 
+    integers with item_encoding. Items are encoded by a join with the 
+    broadcast (item, id) table, so the cost per item doesn't depend on 
+    the number of distinct items.
+    '''
+    key = dataset_key(filename)
+    cached = encoded_cache.get(key[0])
+    instrumentation.cache("encoded_baskets", cached is not None and cached[0] == key)
+    if cached is not None:
+        if cached[0] == key:
+            return cached[1]
+        cached[1].unpersist()
+    ids = init_spark().createDataFrame(list(item_encoding(filename).ids.items()),
+                                       ["item", "item_id"])
+    df = load_baskets(filename)
+    df = df.select("id", explode_outer(df.items).alias("item")) \
+           .join(broadcast(ids), "item", "left") \
+           .groupBy("id") \
+           .agg(collect_list("item_id").alias("item_ids"))
+    df.persist(StorageLevel.MEMORY_AND_DISK)
+    encoded_cache[key[0]] = (key, df)
+    return df
+
+def invalidate_baskets(filename=None):
+    '''
+    Drops the cached basket DataFrame of <filename>, or of every file 
+    if <filename> is None.
+    '''
+    if filename is None:
+        paths = list(baskets_cache.keys())
+    else:
+        paths = [os.path.abspath(filename)]
+    for path in paths:
+        cached = encoded_cache.pop(path, None)
+        if cached is not None:
+            cached[1].unpersist()
+        cached = baskets_cache.pop(path, None)
+        if cached is not None:
+            cached[1].unpersist()
+            basket_counts.pop(cached[0], None)
+            encodings.pop(cached[0], None)
+        for key in [key for key in model_cache if key[0][0] == path]:
+            unpersist_model(model_cache.pop(key))
+
+'''
+FP-GROWTH MODEL CACHE
+
+Fitting FP-Growth is the most expensive step of Part 1, and the 
+itemsets, rules and interests are all derived from the same model. 
+Models are fitted on the integer-encoded baskets (encoded_baskets), so 
+their itemsets and rules are arrays of item ids. 
+Fitted models are kept in an LRU cache keyed by the dataset 
+fingerprint and the (minSupport, minConfidence) parameters.
+'''
+
+MODEL_CACHE_SIZE = 4
+model_cache = OrderedDict()
+model_cache_stats = {"hits": 0, "misses": 0}
+
+@instrumented
+def fpgrowth_model(filename, s, c):
+    '''
+    Returns the FPGrowthModel fitted on the baskets of <filename> with 
+    min support <s> and min confidence <c>. Its freqItemsets and 
+    associationRules DataFrames are persisted, and the number of 
+    baskets it was fitted on is available from basket_count.
+    '''
+    key = (dataset_key(filename), s, c)
+    model = model_cache.get(key)
+    instrumentation.cache("models", model is not None)
+    if model is not None:
+        model_cache.move_to_end(key)
+        model_cache_stats["hits"] += 1
+        return model
+    model_cache_stats["misses"] += 1
+    basket_count(filename)
+    fpGrowth = FPGrowth(itemsCol="item_ids", minSupport=s, minConfidence=c)
+    model = fpGrowth.fit(encoded_baskets(filename))
+    model.freqItemsets.persist(StorageLevel.MEMORY_AND_DISK)
+    model.associationRules.persist(StorageLevel.MEMORY_AND_DISK)
+    model_cache[key] = model
+    while len(model_cache) > MODEL_CACHE_SIZE:
+        unpersist_model(model_cache.popitem(last=False)[1])
+    return model
+
+def unpersist_model(model):
+    model.freqItemsets.unpersist()
+    model.associationRules.unpersist()
+
+def model_cache_info():
+    '''
+    Returns the hit and miss counters and the current size of the 
+    FP-Growth model cache.
+    '''
+    return {"hits": model_cache_stats["hits"],
+            "misses": model_cache_stats["misses"],
+            "size": len(model_cache),
+            "maxsize": MODEL_CACHE_SIZE}
+
+def clear_model_cache():
+    while model_cache:
+        unpersist_model(model_cache.popitem()[1])
+    model_cache_stats["hits"] = 0
+    model_cache_stats["misses"] = 0
+
+@instrumented
 def data_frame(filename, n):
     '''
     Write a function that returns a CSV string representing the first 
@@ -108,16 +423,107 @@ def data_frame(filename, n):
                   DataFrame should return the correct answer.
     Test file: tests/test_data_frame.py
     '''
-    spark = init_spark()
-    lines = spark.read.text(filename).rdd
-    parts= lines.map(lambda row: row.value.split(","))
-    rdd_data = parts.map(lambda p: Row(name=p[0], place=p[1:]))
-    df = spark.createDataFrame(rdd_data)
-    df_indexed = df.select("*").withColumn("id", monotonically_increasing_id())
-    df_final = df_indexed.select("id","name","place")
-    op = toCSVLine(df_final.limit(n))
+    df = load_baskets(filename)
+    df_final = top_n(df.select("id","plant","items"), n, ["id"], [True])
+    op = toCSVLine(df_final)
     return op
 
+@instrumented
+def top_n(df, n, keys, ascending):
+    '''
+    Returns the first <n> rows of <df>, as a list of Rows, sorted by 
+    <keys> in the <ascending> orders. Ties are broken by the columns of 
+    <df> in ascending order, so the result is the same at every run.
+
+    Spark executes a sort followed by a limit as a bounded top-n in 
+    every partition merged on the driver, so <df> is never entirely 
+    sorted.
+    '''
+    rows = df.orderBy(keys + df.columns,
+                      ascending=ascending + [True] * len(df.columns)) \
+             .take(n)
+    instrumentation.rows(len(rows))
+    return rows
+
+'''
+LOCAL FP-GROWTH ENGINE
+
+For small data files, starting the JVM and scheduling Spark jobs costs 
+much more than mining the itemsets. Below FPM_LOCAL_MAX_BYTES, the 
+Part 1 functions read the file in Python and mine it with the Eclat 
+implementation of the itemsets module, which finds the same itemsets, 
+frequencies, rules, confidences and interests. FPM_ENGINE forces one 
+of the engines with "local" or "spark", or selects the SON engine 
+described below with "son".
+'''
+
+FPM_ENGINE = "auto"
+FPM_LOCAL_MAX_BYTES = 16 * 1024 * 1024
+
+local_cache = OrderedDict()
+
+def use_local_fpm(filename):
+    if FPM_ENGINE != "auto":
+        return FPM_ENGINE == "local"
+    return os.path.getsize(filename) <= FPM_LOCAL_MAX_BYTES
+
+local_baskets_cache = {}
+
+@instrumented
+def local_baskets(filename):
+    '''
+    Returns the item_encoding of <filename> and its baskets as lists of 
+    item ids, read without Spark.
+    '''
+    key = dataset_key(filename)
+    cached = local_baskets_cache.get(key[0])
+    instrumentation.cache("local_baskets", cached is not None and cached[0] == key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    baskets = read_baskets(key[0])
+    instrumentation.rows(len(baskets))
+    items_encoding = encoding.item_encoding(item for basket in baskets for item in basket)
+    value = (items_encoding, [items_encoding.encode(basket) for basket in baskets])
+    local_baskets_cache[key[0]] = (key, value)
+    return value
+
+@instrumented
+def local_supports(filename, s):
+    '''
+    Returns a dictionary mapping the frequent itemsets (frozensets of 
+    item ids) of <filename> with min support <s> to their frequency, 
+    and the number of baskets, computed without Spark. Results are kept 
+    in an LRU cache of MODEL_CACHE_SIZE entries.
+    '''
+    key = (dataset_key(filename), s)
+    instrumentation.cache("local_supports", key in local_cache)
+    if key in local_cache:
+        local_cache.move_to_end(key)
+        return local_cache[key]
+    items_encoding, baskets = local_baskets(filename)
+    with instrumentation.stage("mine"):
+        local_cache[key] = (itemsets.mine(baskets, s), len(baskets))
+        instrumentation.rows(len(local_cache[key][0]))
+    while len(local_cache) > MODEL_CACHE_SIZE:
+        local_cache.popitem(last=False)
+    return local_cache[key]
+
+def mined_supports(filename, s):
+    '''
+    Returns the frequent itemsets (frozensets of item ids) of 
+    <filename> with min support <s> and their frequency, the number of 
+    baskets and the item encoding, computed by the local or the SON 
+    engine, or None if FP-Growth must be used.
+    '''
+    if FPM_ENGINE == "son":
+        supports, count = son_supports(filename, s)
+        return supports, count, item_encoding(filename)
+    if use_local_fpm(filename):
+        supports, count = local_supports(filename, s)
+        return supports, count, local_baskets(filename)[0]
+    return None
+
+@instrumented
 def frequent_itemsets(filename, n, s, c):
     '''
     Using the FP-Growth algorithm from the ML library (see 
@@ -131,18 +537,18 @@ def frequent_itemsets(filename, n, s, c):
     Return value: a CSV string. As before, using toCSVLine may help.
     Test: tests/test_frequent_items.py
     '''
-    spark = init_spark()
-    lines = spark.read.text(filename).rdd
-    parts= lines.map(lambda row: row.value.split(","))
-    rdd_data = parts.map(lambda p: Row(name=p[0], items=p[1:]))
-    df = spark.createDataFrame(rdd_data)
-    fpGrowth = FPGrowth(itemsCol="items", minSupport=s, minConfidence=c)
-    model = fpGrowth.fit(df)
-    model_1 = model.freqItemsets.orderBy([size("items"),"freq"],ascending=[0,0])
-    final_op = toCSVLine(model_1.limit(n))
+    mined = mined_supports(filename, s)
+    if mined is not None:
+        supports, count, items_encoding = mined
+        rows = itemsets.top_itemsets(supports, n)
+        return toCSVLine(items_encoding.decode_rows(rows))
+    model = fpgrowth_model(filename, s, c)
+    model_1 = top_n(model.freqItemsets, n, [size("items"),"freq"], [False,False])
+    final_op = toCSVLine(item_encoding(filename).decode_rows(model_1))
     return final_op
     '''return "not implemented"'''
 
+@instrumented
 def association_rules(filename, n, s, c):
     '''
     Using the same FP-Growth algorithm, write a script that returns the 
@@ -154,18 +560,18 @@ def association_rules(filename, n, s, c):
     Return value: a CSV string.
     Test: tests/test_association_rules.py
     '''
-    spark = init_spark()
-    lines = spark.read.text(filename).rdd
-    parts= lines.map(lambda row: row.value.split(","))
-    rdd_data = parts.map(lambda p: Row(name=p[0], items=p[1:]))
-    df = spark.createDataFrame(rdd_data)
-    fpGrowth = FPGrowth(itemsCol="items", minSupport=s, minConfidence=c)
-    model = fpGrowth.fit(df)
-    model_1 = model.associationRules.orderBy([size("antecedent"),"confidence"],ascending=[0,0])
-    model_2 = model_1.drop("lift")
-    final_op = toCSVLine(model_2.limit(n))
+    mined = mined_supports(filename, s)
+    if mined is not None:
+        supports, count, items_encoding = mined
+        rows = itemsets.top_rules(supports, n, c)
+        return toCSVLine(items_encoding.decode_rows(rows))
+    model = fpgrowth_model(filename, s, c)
+    model_1 = model.associationRules.select("antecedent", "consequent", "confidence")
+    model_2 = top_n(model_1, n, [size("antecedent"),"confidence"], [False,False])
+    final_op = toCSVLine(item_encoding(filename).decode_rows(model_2))
     return final_op
 
+@instrumented
 def interests(filename, n, s, c):
     '''
     Using the same FP-Growth algorithm, write a script that computes 
@@ -178,25 +584,335 @@ def interests(filename, n, s, c):
     Return value: a CSV string.
     Test: tests/test_interests.py
     '''
-    spark = init_spark()
-    lines = spark.read.text(filename).rdd
-    parts= lines.map(lambda row: row.value.split(","))
-    rdd_data = parts.map(lambda p: Row(name=p[0], items=p[1:]))
-    df = spark.createDataFrame(rdd_data)
-    total_count = df.count()
-    fpGrowth = FPGrowth(itemsCol="items", minSupport=s, minConfidence=c)
-    model = fpGrowth.fit(df)
-    model_updated = model.associationRules.join(model.freqItemsets,model.associationRules['consequent']==model.freqItemsets['items'])
-    model_with_interest = model_updated.withColumn("interest",lit(calculate_interest(model_updated.confidence,model_updated.freq,total_count)))
-    model_1 = model_with_interest.drop("lift")
-    model_2 = model_1.orderBy([size("antecedent"),"interest"],ascending=[0,0])
-    final_op = toCSVLine(model_2.limit(n))
+    mined = mined_supports(filename, s)
+    if mined is not None:
+        supports, count, items_encoding = mined
+        rows = itemsets.top_interests(supports, n, c, count)
+        return toCSVLine(items_encoding.decode_rows(rows))
+    model = fpgrowth_model(filename, s, c)
+    rules = rule_interests(model, basket_count(filename))
+    model_1 = rules.select("antecedent", "consequent", "confidence", "items", "freq", "interest")
+    model_2 = top_n(model_1, n, [size("antecedent"),"interest"], [False,False])
+    final_op = toCSVLine(item_encoding(filename).decode_rows(model_2))
     return final_op
 
 
 def calculate_interest(confidence,frequency,total_count):
     interest = abs(confidence - (frequency/total_count))
     return interest
+
+@instrumented
+def rule_interests(model, total_count):
+    '''
+    Returns the association rules of <model> with the columns 
+    <antecedent>, <consequent>, <confidence>, <items> (the consequent), 
+    <freq> (the frequency of the consequent), <lift> and <interest>.
+
+    The consequents of FP-Growth rules are single items, so their 
+    frequencies are looked up in a map literal built from the frequent 
+    1-itemsets instead of joining the rules with all the itemsets.
+    '''
+    supports = model.freqItemsets.where(size("items") == 1) \
+                                 .select(col("items")[0], "freq") \
+                                 .collect()
+    support_map = create_map(*[lit(value) for support in supports for value in support])
+    freq = support_map[col("consequent")[0]]
+    return model.associationRules.select(
+        "antecedent", "consequent", "confidence",
+        col("consequent").alias("items"),
+        freq.alias("freq"),
+        (col("confidence") / (freq / total_count)).alias("lift"),
+        calculate_interest(col("confidence"), freq, total_count).alias("interest"))
+
+'''
+INCREMENTAL FREQUENT ITEMSETS
+
+The data file grows by appending baskets. Instead of mining it again 
+from scratch, the frequent itemsets of the previous run, their 
+frequencies and the number of baskets are kept, and only the appended 
+baskets are read (FUP algorithm). Itemsets are updated level by level, 
+the itemsets of size k + 1 being generated from the frequent itemsets 
+of size k (itemsets.apriori_gen):
+- the frequencies of the known frequent itemsets are updated by 
+  counting them in the appended baskets;
+- an itemset that wasn't frequent can only become frequent if it is 
+  frequent among the appended baskets, so only these new candidates 
+  are counted in the whole file.
+A single wide appended basket thus only yields the candidates whose 
+subsets are all frequent, instead of all its subsets.
+Only complete lines are read: a last line without a line terminator 
+may still be being written, so it is left for the next call. If the 
+file shrank, or the end of the lines already read changed 
+(prefix_fingerprint), it was rewritten and is mined again.
+'''
+
+incremental_state = {}
+
+@instrumented
+def incremental_supports(filename, s, c):
+    '''
+    Returns a dictionary mapping the frequent itemsets (frozensets) of 
+    the complete lines of <filename> with min support <s> to their 
+    frequency, and the number of baskets. The first call mines the 
+    whole file (reusing the cached model of parameters <s> and <c> if 
+    any), the next ones only the lines completed since the previous 
+    call.
+    '''
+    path = os.path.abspath(filename)
+    file_size = os.path.getsize(path)
+    state = incremental_state.get((path, s))
+    if state is not None and (file_size < state["offset"] or
+                              prefix_fingerprint(path, state["offset"]) != state["fingerprint"]):
+        state = None
+    instrumentation.cache("incremental", state is not None)
+    if state is None:
+        end = complete_end(path, 0, file_size)
+        supports, count = complete_supports(filename, s, c, end, file_size)
+        state = {"offset": end, "count": count, "supports": supports,
+                 "fingerprint": prefix_fingerprint(path, end)}
+        incremental_state[(path, s)] = state
+        return state["supports"], state["count"]
+    end = complete_end(path, state["offset"], file_size)
+    if end == state["offset"]:
+        return state["supports"], state["count"]
+
+    delta = read_baskets(path, state["offset"], end)
+    instrumentation.rows(len(delta))
+    count = state["count"] + len(delta)
+    threshold = itemsets.min_count(s, count)
+    delta_threshold = itemsets.min_count(s, len(delta))
+    previous = state["supports"]
+    baskets = None
+    supports = {}
+    level = set(frozenset([item]) for basket in delta for item in basket)
+    level.update(itemset for itemset in previous if len(itemset) == 1)
+    while level:
+        delta_counts = itemsets.count_tidsets(delta, level)
+        candidates = []
+        for itemset in level:
+            if itemset in previous:
+                supports[itemset] = previous[itemset] + delta_counts[itemset]
+            elif delta_counts[itemset] >= delta_threshold:
+                candidates.append(itemset)
+        if candidates and use_local_fpm(filename):
+            if baskets is None:
+                baskets = read_baskets(path, 0, end)
+            supports.update(itemsets.count_tidsets(baskets, candidates))
+        elif candidates:
+            if baskets is None:
+                baskets = complete_baskets(load_baskets(filename), end, file_size)
+            supports.update(count_itemsets_spark(baskets, candidates))
+        frequent = set(itemset for itemset in level if supports.get(itemset, 0) >= threshold)
+        level = itemsets.apriori_gen(frequent, frequent)
+
+    state["supports"] = dict((itemset, freq) for itemset, freq in supports.items()
+                             if freq >= threshold)
+    state["offset"] = end
+    state["fingerprint"] = prefix_fingerprint(path, end)
+    state["count"] = count
+    return state["supports"], state["count"]
+
+def prefix_fingerprint(path, end):
+    '''
+    Returns the SHA-1 of the last 64 KiB before the byte offset <end> 
+    of <path>. Together with <end>, it tells if the lines already read 
+    were rewritten instead of appended to.
+    '''
+    with open(path, "rb") as f:
+        start = end - 65536 if end > 65536 else 0
+        f.seek(start)
+        return hashlib.sha1(f.read(end - start)).hexdigest()
+
+def complete_supports(filename, s, c, end, file_size):
+    '''
+    Returns a dictionary mapping the frequent itemsets (frozensets) of 
+    the lines of <filename> before the byte offset <end> with min 
+    support <s> to their frequency, and the number of baskets. When 
+    <end> is the size of the file, the results of the Part 1 engines 
+    are reused; otherwise the last, incomplete line is left out.
+    '''
+    if end == file_size:
+        mined = mined_supports(filename, s)
+        if mined is not None:
+            supports, count, items_encoding = mined
+            supports = supports.items()
+        else:
+            items_encoding = item_encoding(filename)
+            model = fpgrowth_model(filename, s, c)
+            supports = model.freqItemsets.collect()
+            count = basket_count(filename)
+        return dict((frozenset(items_encoding.decode(items)), freq)
+                    for items, freq in supports), count
+    if use_local_fpm(filename):
+        baskets = read_baskets(filename, 0, end)
+        return itemsets.mine(baskets, s), len(baskets)
+    items_encoding = item_encoding(filename)
+    baskets = complete_baskets(encoded_baskets(filename), end, file_size)
+    model = FPGrowth(itemsCol="item_ids", minSupport=s, minConfidence=c).fit(baskets)
+    return dict((frozenset(items_encoding.decode(items)), freq)
+                for items, freq in model.freqItemsets.collect()), baskets.count()
+
+def complete_baskets(baskets, end, file_size):
+    '''
+    Returns the DataFrame of <baskets> of a file without the last one 
+    if the file doesn't end with a line terminator, i.e. if <end> is 
+    before <file_size>.
+    '''
+    if end < file_size:
+        baskets = baskets.where(col("id") != baskets.agg(max("id")).first()[0])
+    return baskets
+
+def complete_end(path, start, end):
+    '''
+    Returns the byte offset following the last line terminator between 
+    the offsets <start> and <end> of <path>, or <start> if there is 
+    none. A "\\r" at <end> may be the beginning of a "\\r\\n", so it 
+    doesn't terminate a line yet.
+    '''
+    with open(path, "rb") as f:
+        position = end
+        while position > start:
+            block_start = position - 65536 if position - 65536 > start else start
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            if position == end and block.endswith(b"\r"):
+                block = block[:-1]
+            index = block.rfind(b"\n")
+            if block.rfind(b"\r") > index:
+                index = block.rfind(b"\r")
+            if index >= 0:
+                return block_start + index + 1
+            position = block_start
+    return start
+
+def read_baskets(path, start=0, end=None):
+    '''
+    Returns the item lists of the lines between the byte offsets 
+    <start> and <end> (the end of the file by default) of <path>, 
+    parsed like load_baskets does.
+    '''
+    if start == end:
+        return []
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(-1 if end is None else end - start).decode("utf-8", "replace")
+    if not text:
+        return []
+    lines = re.split("\r\n|\r|\n", text)
+    if text.endswith("\n") or text.endswith("\r"):
+        lines.pop()
+    return [line.split(",")[1:] for line in lines]
+
+@instrumented
+def count_itemsets_spark(df, candidates, column="items"):
+    '''
+    Returns a dictionary mapping every itemset of <candidates> to the 
+    number of baskets of the DataFrame <df> (their items being in 
+    <column>) that contain it. Partitions are counted by chunks of 
+    SON_CHUNK_BASKETS baskets.
+    '''
+    broadcast = spark_context().broadcast(list(candidates))
+    chunk_size = SON_CHUNK_BASKETS
+    def count_partition(rows):
+        counts = {}
+        for chunk in itemsets.chunks((row[0] for row in rows), chunk_size):
+            for itemset, count in itemsets.count_tidsets(chunk, broadcast.value).items():
+                counts[itemset] = counts.get(itemset, 0) + count
+        return counts.items()
+    counts = df.select(column).rdd \
+               .mapPartitions(count_partition) \
+               .reduceByKey(lambda a, b: a + b) \
+               .collectAsMap()
+    broadcast.unpersist()
+    return dict((itemset, counts.get(itemset, 0)) for itemset in candidates)
+
+'''
+SON FREQUENT ITEMSETS
+
+On very large files with a low min support, the conditional FP-trees 
+of FP-Growth may not fit in the memory of the executors. With 
+FPM_ENGINE set to "son", the frequent itemsets are mined from the 
+encoded baskets with the SON algorithm, in two passes:
+1. the baskets are spread evenly over partitions of at least 
+   SON_CHUNK_BASKETS baskets, and every partition is mined with Eclat 
+   by chunks of SON_CHUNK_BASKETS / 2 to SON_CHUNK_BASKETS baskets 
+   (see itemsets.chunks), which bounds its memory. A chunk of a few 
+   baskets would make almost all their subsets candidates. The 
+   itemsets frequent in at least one chunk are the candidates;
+2. the candidates are counted exactly in all the baskets.
+If TOIVONEN_SAMPLE is set, a fraction of the baskets is first mined on 
+the driver with a support lowered by TOIVONEN_LOWERING, and only these 
+itemsets and their negative border are counted. If an itemset of the 
+border turns out to be frequent, the result may be incomplete and the 
+SON passes are run instead. In all cases the result is exact.
+'''
+
+SON_CHUNK_BASKETS = 100000
+TOIVONEN_SAMPLE = None
+TOIVONEN_LOWERING = 0.8
+TOIVONEN_SEED = 0
+
+@instrumented
+def son_supports(filename, s):
+    '''
+    Returns a dictionary mapping the frequent itemsets (frozensets of 
+    item ids) of <filename> with min support <s> to their frequency, 
+    and the number of baskets, mined with the SON algorithm. Results 
+    are kept in the LRU cache of the local engine.
+    '''
+    key = (dataset_key(filename), s, "son")
+    instrumentation.cache("son_supports", key in local_cache)
+    if key in local_cache:
+        local_cache.move_to_end(key)
+        return local_cache[key]
+    df = encoded_baskets(filename).select("item_ids")
+    count = basket_count(filename)
+    threshold = itemsets.min_count(s, count)
+    counts = None
+    if TOIVONEN_SAMPLE:
+        with instrumentation.stage("toivonen"):
+            sample = [row[0] for row in df.sample(False, TOIVONEN_SAMPLE, TOIVONEN_SEED).collect()]
+            frequent, border = itemsets.toivonen_candidates(
+                sample, s, range(len(item_encoding(filename))), TOIVONEN_LOWERING)
+            counts = count_itemsets_spark(df, frequent | border, "item_ids")
+            if any(counts[itemset] >= threshold for itemset in border):
+                counts = None
+    if counts is None:
+        with instrumentation.stage("son"):
+            chunk_size = SON_CHUNK_BASKETS
+            def mine_partition(rows):
+                chunks = itemsets.chunks((row[0] for row in rows), chunk_size)
+                return itemsets.son_candidates(chunks, s)
+            partitions = count // chunk_size if count > chunk_size else 1
+            candidates = df.repartition(partitions).rdd \
+                           .mapPartitions(mine_partition) \
+                           .distinct() \
+                           .collect()
+            counts = count_itemsets_spark(df, candidates, "item_ids")
+    supports = dict((itemset, freq) for itemset, freq in counts.items() if freq >= threshold)
+    local_cache[key] = (supports, count)
+    while len(local_cache) > MODEL_CACHE_SIZE:
+        local_cache.popitem(last=False)
+    return local_cache[key]
+
+@instrumented
+def incremental_frequent_itemsets(filename, n, s, c):
+    '''
+    Same as frequent_itemsets, with the itemsets maintained 
+    incrementally when lines are appended to <filename>.
+    '''
+    supports, count = incremental_supports(filename, s, c)
+    return toCSVLine(itemsets.top_itemsets(supports, n))
+
+@instrumented
+def incremental_association_rules(filename, n, s, c):
+    '''
+    Same as association_rules, with the itemsets maintained 
+    incrementally when lines are appended to <filename>.
+    '''
+    supports, count = incremental_supports(filename, s, c)
+    return toCSVLine(itemsets.top_rules(supports, n, c))
+
 '''
 PART 2: CLUSTERING
 
@@ -216,6 +932,7 @@ seed than used in the tests was used). The classes seem to make sense
 from a geographical point of view!
 '''
 
+@instrumented
 def data_preparation(filename, plant, state):
     '''
     This function creates an RDD in which every element is a tuple with 
@@ -233,39 +950,59 @@ def data_preparation(filename, plant, state):
     Return value: True if the plant occurs in the state and False otherwise.
     Test: tests/test_data_preparation.py
     '''
-    spark = init_spark()
-    lines = spark.read.text(filename).rdd
-    parts= lines.map(lambda row: row.value.split(","))
-    rdd_data = parts.map(lambda p: Row(plant_name=p[0], states=p[1:]))
-    global data_df
-    data_df = spark.createDataFrame(rdd_data)
-    data_df.cache()
-    all_plants = data_df.select(data_df.plant_name).rdd.flatMap(lambda x: x).collect()
-    rdd=createDict(data_df,all_plants)
-    global data_f
-    data_f = spark.createDataFrame(rdd)
-    data_f.cache()
-    dict_op=getFromDict(state)
-    row = Row(**dict_op[0][0])
-    if  plant in row.asDict().keys() and row.asDict()[plant]==1:
-        return True
-    else:
-        return False
-
-def getFromDict(state):
-    dict_op = data_f.select(data_f._2).where(data_f._1==state).collect()
-    return dict_op
-
-def createDict(df,all_plants):
-    dict_list=[()]
-    for state in states:
-        plant_names = df.select(df.plant_name).where(array_contains(df.states,state)).rdd.flatMap(lambda x: x).collect()
-        dict1= dict( [ (plant_name,1) if plant_name in plant_names  else (plant_name,0) for plant_name in all_plants] )
-        tuple_data=(state,dict1)
-        dict_list.append(tuple_data)
-    rdd = sc.parallelize(dict_list[1:])
-    return rdd
+    vectors = state_vectors(filename)
+    return vectors.contains(state, plant)
+
+vectors_cache = {}
 
+@instrumented
+def state_vectors(filename):
+    '''
+    Returns the StateVectors of <filename>: the sorted plant index and 
+    one packed bitset per state of all_states. They are built once per 
+    version of the file, or opened from the disk cache.
+    '''
+    key = dataset_key(filename)
+    cached = vectors_cache.get(key[0])
+    instrumentation.cache("vectors", cached is not None and cached[0] == key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    directory = cache_directory(filename)
+    vectors = None if directory is None else disk_cache.load_vectors(directory, states)
+    instrumentation.cache("disk_vectors", vectors is not None)
+    if vectors is None:
+        baskets = load_baskets(filename)
+        all_plants = baskets.select(baskets.plant).rdd.flatMap(lambda x: x).collect()
+        vectors = StateVectors.from_groups(states, all_plants, statePlants(baskets))
+        if directory is not None:
+            disk_cache.save_vectors(directory, vectors)
+    vectors_cache[key[0]] = (key, vectors)
+    return vectors
+
+@instrumented
+def statePlants(df):
+    '''
+    Returns a dictionary mapping every state to the list of plants 
+    found in it, computed in a single explode/group-by pass.
+    '''
+    pairs = df.select(explode(df.items).alias("state"), df.plant)
+    groups = dict(pairs.groupBy("state")
+                       .agg(collect_set("plant"))
+                       .collect())
+    instrumentation.rows(len(groups))
+    return groups
+
+@instrumented
+def createDict(filename):
+    '''
+    Returns the RDD of (state, {plant: 0 or 1}) tuples described in 
+    data_preparation. The dictionaries are only built when this 
+    function is called.
+    '''
+    vectors = state_vectors(filename)
+    return spark_context().parallelize([(state, vectors.as_dict(state)) for state in vectors.states])
+
+@instrumented
 def distance2(filename, state1, state2):
     '''
     This function computes the squared Euclidean
@@ -274,15 +1011,19 @@ def distance2(filename, state1, state2):
     Return value: an integer.
     Test: tests/test_distance.py
     '''
-    tuple_list1 = [()]
-    tuple_list2 = [()]
-    dict_op1=getFromDict(state1)
-    dict_op2=getFromDict(state2)
-    list1=list(dict_op1[0][0].values())
-    list2=list(dict_op2[0][0].values())
-    points = zip(list1, list2)
-    diffs_squared_distance = [pow(a - b, 2) for (a, b) in points]
-    return sum(diffs_squared_distance)
+    return state_vectors(filename).distance2(state1, state2)
+
+@instrumented
+def pairwise_distances(filename, states_a, states_b):
+    '''
+    This function computes the squared Euclidean distances between 
+    every state of <states_a> and every state of <states_b> at once.
+
+    Return value: a matrix (numpy array) of integers with one row per 
+                  state of <states_a> and one column per state of 
+                  <states_b>.
+    '''
+    return state_vectors(filename).pairwise_distances(states_a, states_b)
 
 def init_centroids(k, seed):
     '''
@@ -307,6 +1048,7 @@ def init_centroids(k, seed):
     random_states = random.sample(all_states.all_states,k)
     return random_states
 
+@instrumented
 def first_iter(filename, k, seed):
     '''
     This function assigns each state to its 'closest' class, where 'closest'
@@ -325,30 +1067,30 @@ def first_iter(filename, k, seed):
     random.seed(seed)
     centers =random.sample(states,k)
     data_points_index = list(states_fi)
-    v = assign_states(centers)
+    v = assign_states(filename, centers)
     return v            
     
 
-def assign_states(centers):
-    iter_dict={}
-    for iteration in range(1):
-        for data_point_index in data_points_index:
-            min_value = float('inf')
-            min_goal = None
-            min_data_point = None
-            data_point_center_distance=[]
-            for center in centers:
-                calculated_distance = distance2("name",data_point_index,center)
-                data_point_center_distance.append(calculated_distance)
-                index=data_point_center_distance.index(min(data_point_center_distance))
-            iter_dict[data_point_index]=centers[index]
-    
+@instrumented
+def assign_states(filename, centers):
+    if use_spark_kmeans(filename):
+        points, dimension = state_points(filename)
+        centroids = clustering.spark_centroids(points, [states.index(center) for center in centers], dimension)
+        closest = clustering.assign_spark(spark_context(), points, centroids)
+        closest = [closest[states.index(state)] for state in data_points_index]
+    else:
+        distances = pairwise_distances(filename, data_points_index, centers)
+        # argmin keeps the first closest center, in the order of <centers>.
+        closest = distances.argmin(axis=1)
+    iter_dict = dict(zip(data_points_index, [centers[index] for index in closest]))
+
     v = {}
 
     for key, value in sorted(iter_dict.items()):
         v.setdefault(value, []).append(key)
     return v
 
+@instrumented
 def kmeans(filename, k, seed):
     '''
     This function:
@@ -367,48 +1109,247 @@ def kmeans(filename, k, seed):
                   and "ca".
     Test file: tests/test_kmeans.py
     '''
-    '''spark = init_spark()
-    states_fi=sorted(states)
-    random.seed(seed)
-    centroids =random.sample(states,k)
-    first_iter_centroids=assign_states(centroids)
-    print(first_iter_centroids)
-    while True:
-    old_clusters = assign_states(centroids)
-    print(old_clusters)
-    new_clusters = recalculate_cluster_centroids(old_clusters)
-    print(new_clusters.collectAsMap())
-    new_cluster_keys = new_clusters.keys().collect()
-    if(new_clusters==None):
-        return []
-    if first_iter_centroids.keys().collect() == new_clusters.keys().collect():
-        return best_clusters
-            
-    print(new_clusters)'''
-    return []
-
-def recalculate_cluster_centroids(clusters):
-    rdd_clusters=sc.parallelize(clusters)
-    op=rdd_clusters.values().map(lambda points: (assign_states(points)))
-    print(op)
-    return op
+    return clustering.classes(states, kmeans_assignments(filename, k, seed))
 
-'''def nearest_centroid(values,centers):
-    iter_dict={}
-    for iteration in range(1):
-        for value in values:
-            min_value = float('inf')
-            min_goal = None
-            min_data_point = None
-            data_point_center_distance=[]
-            for center in centers:
-                calculated_distance = distance2("name",value,center)
-                data_point_center_distance.append(calculated_distance)
-                index=data_point_center_distance.index(min(data_point_center_distance))
-            iter_dict[value]=centers[index]
-    
-    v = {}
+def kmeans_assignments(filename, k, seed):
+    '''
+    Returns the index of the class of every state of all_states found 
+    by kmeans.
+    '''
+    centroids = init_centroids(k, seed)
+    if use_spark_kmeans(filename):
+        points, dimension = state_points(filename)
+        with instrumentation.stage("lloyd_spark"):
+            result = clustering.lloyd_spark(spark_context(), points, dimension,
+                                            [states.index(state) for state in centroids])
+        return [result.assignments[index] for index in range(len(states))]
+    vectors = state_vectors(filename)
+    with instrumentation.stage("lloyd"):
+        result = clustering.lloyd(vectors.dense(),
+                                  [vectors.state_index[state] for state in centroids],
+                                  assignment=KMEANS_ASSIGNMENT)
+    return result.assignments
 
-    for key, value in sorted(iter_dict.items()):
-        v.setdefault(value, []).append(key)
-    return v,value'''
+@instrumented
+def kmeans_sweep(filename, ks, seeds, processes=None):
+    '''
+    This function runs kmeans for every <k> of <ks> and every seed of 
+    <seeds>, initialized as in init_centroids. The state vectors are 
+    built once and the runs are executed in parallel by <processes> 
+    worker processes.
+
+    Return value: a dictionary with two entries:
+    - "runs": a list with one dictionary per (k, seed) run, with keys 
+      "k", "seed", "classes" (as returned by kmeans), "inertia" and 
+      "iterations".
+    - "best": a dictionary mapping every k to its run of lowest inertia 
+      (the first one in case of ties).
+    '''
+    vectors = state_vectors(filename)
+    grid = [(k, seed) for k in ks for seed in seeds]
+    initials = [[vectors.state_index[state] for state in init_centroids(k, seed)]
+                for (k, seed) in grid]
+    results = clustering.sweep(vectors.bits, vectors.dimension, initials, processes,
+                               assignment=KMEANS_ASSIGNMENT)
+    runs = []
+    best = {}
+    for (k, seed), (assignments, iterations, inertia) in zip(grid, results):
+        run = {"k": k, "seed": seed,
+               "classes": clustering.classes(vectors.states, assignments),
+               "inertia": inertia, "iterations": iterations}
+        runs.append(run)
+        if k not in best or inertia < best[k]["inertia"]:
+            best[k] = run
+    return {"runs": runs, "best": best}
+
+'''
+STREAMING KMEANS
+
+Once the states are clustered, new baskets can be applied to the 
+classes without running data_preparation and kmeans again. 
+save_kmeans_model persists the classes of a kmeans run with the plant 
+index, and stream_kmeans or stream_kmeans_directory apply batches of 
+new basket lines to them (see streaming.py): only the states touched by 
+a batch are assigned again. The model is saved every 
+STREAM_SAVE_EVERY batches, when a stream_kmeans generator ends and when 
+the query of stream_kmeans_directory is stopped.
+'''
+
+STREAM_SAVE_EVERY = 10
+
+def save_kmeans_model(filename, k, seed, path):
+    '''
+    Runs kmeans on <filename> and saves its classes, the state vectors 
+    and the plant index to the .npz file <path>.
+
+    Return value: the classes, as returned by kmeans.
+    '''
+    model = streaming.StreamingKMeans.from_vectors(state_vectors(filename),
+                                                   kmeans_assignments(filename, k, seed), k)
+    model.save(path)
+    return model.classes()
+
+def stream_kmeans(path, batches, save_every=None):
+    '''
+    Applies every batch of <batches>, an iterable of lists of basket 
+    lines, to the model saved at <path> by save_kmeans_model. The model 
+    is saved every <save_every> batches (STREAM_SAVE_EVERY by default).
+
+    Return value: a generator of the (state, old class, new class) 
+                  tuples of the states that changed class, one list per 
+                  batch. Classes are centroid indices.
+    '''
+    if save_every is None:
+        save_every = STREAM_SAVE_EVERY
+    model = streaming.StreamingKMeans.load(path)
+    try:
+        for batch, lines in enumerate(batches, 1):
+            yield model.update_lines(lines)
+            if batch % save_every == 0:
+                model.save(path)
+    finally:
+        model.save(path)
+
+def stream_kmeans_directory(path, directory, callback, save_every=None):
+    '''
+    Same as stream_kmeans, with the basket lines of the files added to 
+    <directory> read by Spark Structured Streaming. 
+    callback(batch_id, changes) is called after every micro-batch.
+
+    Return value: a KMeansStream, the StreamingQuery whose stop() also 
+                  saves the model.
+    '''
+    if save_every is None:
+        save_every = STREAM_SAVE_EVERY
+    model = streaming.StreamingKMeans.load(path)
+    def process(df, batch_id):
+        parts = split(col("value"), ",")
+        pairs = df.select(parts.alias("parts")) \
+                  .select(col("parts")[0].alias("plant"),
+                          explode(expr("slice(parts, 2, size(parts) - 1)")).alias("state")) \
+                  .where(col("state").isin(model.states)) \
+                  .collect()
+        changes = model.update([(row.plant, row.state) for row in pairs])
+        if (batch_id + 1) % save_every == 0:
+            model.save(path)
+        callback(batch_id, changes)
+    query = init_spark().readStream.text(directory) \
+                        .writeStream.foreachBatch(process) \
+                        .start()
+    return KMeansStream(query, model, path)
+
+class KMeansStream:
+    '''
+    The StreamingQuery <query> of stream_kmeans_directory, applying 
+    micro-batches to <model>. stop() stops the query, then saves the 
+    model to <path>, so the batches since the last save aren't lost. 
+    The other attributes are the ones of the query.
+    '''
+
+    def __init__(self, query, model, path):
+        self.query = query
+        self.model = model
+        self.path = path
+
+    def __getattr__(self, name):
+        return getattr(self.query, name)
+
+    def stop(self):
+        self.query.stop()
+        self.model.save(self.path)
+
+'''
+KMEANS EXECUTION MODE
+
+The state vectors of small data files are clustered in memory, on the 
+driver. Above KMEANS_LOCAL_MAX_CELLS vector components (states x 
+plants), kmeans and first_iter keep the vectors in a cached RDD and 
+only exchange the centroids with the executors. The number of plants 
+is bounded without starting Spark (plant_count), so the local mode 
+doesn't use it when the vectors come from the disk cache. 
+KMEANS_ENGINE forces one of the modes with "local" or "spark".
+
+In memory, KMEANS_ASSIGNMENT selects how states are assigned to 
+centroids: "exhaustive" computes every distance, "elkan" skips the 
+ones that bounds prove useless and returns the same classes. There are 
+only len(all_states) points, too few for the bounds to pay for their 
+upkeep, so "exhaustive" is the default.
+'''
+
+KMEANS_ENGINE = "auto"
+KMEANS_ASSIGNMENT = "exhaustive"
+KMEANS_LOCAL_MAX_CELLS = 100000000
+
+def use_spark_kmeans(filename):
+    if KMEANS_ENGINE != "auto":
+        return KMEANS_ENGINE == "spark"
+    return len(states) * plant_count(filename) > KMEANS_LOCAL_MAX_CELLS
+
+line_counts = {}
+
+def plant_count(filename):
+    '''
+    Returns the number of plants of <filename>, or an upper bound of it, 
+    without running a Spark job: the dimension of its state vectors or 
+    points if they are loaded, else its number of baskets, counted in 
+    Python once per version of the file if it isn't known yet.
+    '''
+    key = dataset_key(filename)
+    cached = vectors_cache.get(key[0])
+    if cached is not None and cached[0] == key:
+        return cached[1].dimension
+    cached = points_cache.get(key[0])
+    if cached is not None and cached[0] == key:
+        return cached[1][1]
+    cached = line_counts.get(key[0])
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if key in basket_counts:
+        return basket_counts[key]
+    newlines = returns = 0
+    last = b"\n"
+    with open(key[0], "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            newlines += block.count(b"\n")
+            returns += block.count(b"\r")
+            last = block[-1:]
+    lines = newlines if newlines > returns else returns
+    lines = lines if last in (b"\n", b"\r") else lines + 1
+    line_counts[key[0]] = (key, lines)
+    return lines
+
+points_cache = {}
+
+@instrumented
+def state_points(filename):
+    '''
+    Returns a cached RDD of (state index, plant ids) tuples, where the 
+    state index is the position of the state in all_states and the 
+    plant ids are the sorted positions of its plants in the 
+    alphabetical plant index, and the number of plants.
+    '''
+    key = dataset_key(filename)
+    cached = points_cache.get(key[0])
+    instrumentation.cache("points", cached is not None and cached[0] == key)
+    if cached is not None:
+        if cached[0] == key:
+            return cached[1]
+        cached[1][0].unpersist()
+    baskets = load_baskets(filename)
+    plant_ids = baskets.select(baskets.plant).distinct().rdd \
+                       .map(lambda row: row[0]) \
+                       .sortBy(lambda plant: plant) \
+                       .zipWithIndex()
+    state_ids = dict((state, index) for index, state in enumerate(states))
+    pairs = baskets.select(baskets.plant, explode(baskets.items).alias("state")) \
+                   .where(col("state").isin(states)).rdd \
+                   .map(lambda row: (row.plant, state_ids[row.state]))
+    ids = pairs.join(plant_ids).map(lambda pair: pair[1])
+    points = spark_context().parallelize(range(len(states))) \
+               .map(lambda index: (index, None)) \
+               .cogroup(ids) \
+               .mapValues(lambda groups: np.array(sorted(groups[1]), dtype=np.int64))
+    points.persist(StorageLevel.MEMORY_AND_DISK)
+    value = (points, plant_ids.count())
+    points_cache[key[0]] = (key, value)
+    return value
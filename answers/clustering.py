@@ -0,0 +1,440 @@
+'''
+Kmeans engine for the clustering part of the assignment.
+
+Points are binary vectors (rows of a dense 0/1 matrix). A centroid is
+kept as the sum of its points and their count, so that the dot products
+between points and centroid sums are exact integers whatever the
+summation order. Squared distances are then derived with the same
+float operations by every execution mode, which makes their results
+comparable bit for bit.
+'''
+
+import os
+import tempfile
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+MAX_ITERATIONS = 100
+
+# Slack on the bounds of the "elkan" assignment, relative to the
+# magnitude of the squared distances, to absorb rounding errors.
+BOUND_TOLERANCE = 1e-9
+
+# Upper bound on the size of the float64 copies of the uint8 points
+# made by point_dots.
+DOT_BLOCK_BYTES = 1 << 24
+
+KMeansResult = namedtuple("KMeansResult",
+                          ["assignments", "centroids", "iterations", "inertia", "skipped"])
+
+class Centroids:
+    '''
+    Centroids of a kmeans run.
+
+    - sums: (k x D) float64 matrix, the sum of the points of every
+      cluster (integer valued).
+    - counts: the number of points of every cluster.
+    '''
+
+    def __init__(self, sums, counts):
+        self.sums = sums
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.means = sums / self.counts[:, None]
+        self.norms = (self.means * self.means).sum(axis=1)
+
+    @classmethod
+    def from_points(cls, points, indices):
+        '''
+        Returns the centroids located at the points of <indices>.
+        '''
+        return cls(np.array(points[indices], dtype=np.float64), np.ones(len(indices)))
+
+    def __len__(self):
+        return len(self.counts)
+
+    def distances(self, dots, norms):
+        '''
+        Returns the squared distances from points to the centroids,
+        given <dots>, the dot products between the points and the
+        centroid sums (one row per point), and <norms>, the squared
+        norms of the points.
+        '''
+        return norms[:, None] - 2 * dots / self.counts + self.norms
+
+    def pair_distances(self, dots, norms, columns):
+        '''
+        Returns the squared distances between pairs of points and
+        centroids, as distances does, given the dot products, the point
+        norms and the centroid indices of the pairs.
+        '''
+        return norms - 2 * dots / self.counts[columns] + self.norms[columns]
+
+    def separations(self):
+        '''
+        Returns the (k x k) matrix of Euclidean distances between the
+        centroids.
+        '''
+        return np.array([np.sqrt(((self.means - mean) ** 2).sum(axis=1)) for mean in self.means])
+
+class SparsePoints:
+    '''
+    Compressed rows of a 0/1 matrix: the coordinates equal to 1 of
+    point i are indices[indptr[i]:indptr[i + 1]].
+    '''
+
+    def __init__(self, points):
+        rows, self.indices = np.nonzero(points)
+        self.lengths = np.bincount(rows, minlength=len(points))
+        self.indptr = np.concatenate([[0], np.cumsum(self.lengths)])
+
+    def gather(self, rows):
+        '''
+        Returns the concatenated coordinates of the points of <rows>.
+        '''
+        lengths = self.lengths[rows]
+        ends = np.cumsum(lengths)
+        offsets = np.repeat(self.indptr[rows] - (ends - lengths), lengths)
+        return self.indices[offsets + np.arange(ends[-1] if len(ends) else 0)]
+
+    def dots(self, sums, rows, columns):
+        '''
+        Returns the dot products between the points of <rows> and the
+        rows <columns> of <sums>, pair by pair.
+        '''
+        lengths = self.lengths[rows]
+        values = sums[np.repeat(columns, lengths), self.gather(rows)]
+        dots = np.zeros(len(rows))
+        nonempty = lengths > 0
+        if nonempty.any():
+            starts = np.cumsum(lengths) - lengths
+            dots[nonempty] = np.add.reduceat(values, starts[nonempty])
+        return dots
+
+    def move(self, sums, rows, source, target):
+        '''
+        Moves the points of <rows> from the sums of clusters <source> to
+        the sums of clusters <target>.
+        '''
+        lengths = self.lengths[rows]
+        coordinates = self.gather(rows)
+        np.subtract.at(sums, (np.repeat(source, lengths), coordinates), 1)
+        np.add.at(sums, (np.repeat(target, lengths), coordinates), 1)
+
+def point_norms(points):
+    return points.sum(axis=1, dtype=np.float64)
+
+def point_dots(points, sums):
+    '''
+    Returns the dot products between every point of <points> (rows) and
+    every row of <sums> (columns). Points stored as uint8 are converted
+    to float64 by blocks of rows, so that they are never copied whole.
+    '''
+    if points.dtype == np.float64:
+        return points.dot(sums.T)
+    out = np.empty((len(points), len(sums)))
+    rows = max(1, DOT_BLOCK_BYTES // max(1, 8 * points.shape[1]))
+    for start in range(0, len(points), rows):
+        out[start:start + rows] = points[start:start + rows].astype(np.float64).dot(sums.T)
+    return out
+
+def assign(points, norms, centroids):
+    '''
+    Returns the index of the closest centroid of every point (the first
+    one in case of ties) and the corresponding squared distances, with
+    one matrix product.
+    '''
+    distances = centroids.distances(point_dots(points, centroids.sums), norms)
+    closest = distances.argmin(axis=1)
+    return closest, distances[np.arange(len(closest)), closest]
+
+def update(points, assignments, previous):
+    '''
+    Returns the centroids computed as the means of the points assigned
+    to them. A centroid without points keeps its previous position.
+    '''
+    k = len(previous)
+    sums = np.zeros_like(previous.sums)
+    np.add.at(sums, assignments, points)
+    counts = np.bincount(assignments, minlength=k).astype(np.float64)
+    empty = counts == 0
+    sums[empty] = previous.sums[empty]
+    counts[empty] = previous.counts[empty]
+    return Centroids(sums, counts)
+
+def lloyd(points, initial, max_iterations=MAX_ITERATIONS, assignment="exhaustive"):
+    '''
+    Runs Lloyd's algorithm on <points>, a (N x D) 0/1 matrix, starting
+    from the centroids located at the points of indices <initial>.
+    A uint8 matrix (possibly memory-mapped) is used as is, without 
+    being converted to float64.
+    Iterations stop when the assignments don't change anymore.
+
+    With <assignment> "exhaustive", every point-centroid distance is 
+    computed at every iteration. With "elkan", bounds on the distances 
+    are kept to skip the computations that cannot change an assignment;
+    the result is the same.
+
+    Return value: a KMeansResult with the index of the centroid of
+                  every point, the final (k x D) centroids, the number
+                  of assignment steps, the inertia (sum of squared
+                  distances to the closest centroids) and the number of
+                  distance computations skipped at every iteration.
+    '''
+    points = np.asarray(points)
+    if points.dtype != np.uint8:
+        points = np.asarray(points, dtype=np.float64)
+    if assignment == "elkan":
+        return lloyd_elkan(points, initial, max_iterations)
+    if assignment != "exhaustive":
+        raise ValueError("Unknown assignment: " + str(assignment))
+    norms = point_norms(points)
+    centroids = Centroids.from_points(points, initial)
+    assignments = None
+    for iteration in range(1, max_iterations + 1):
+        closest, distances = assign(points, norms, centroids)
+        if assignments is not None and np.array_equal(closest, assignments):
+            break
+        assignments = closest
+        centroids = update(points, assignments, centroids)
+    return KMeansResult(assignments, centroids.means, iteration, float(distances.sum()),
+                        [0] * iteration)
+
+def positioned(sums, counts, previous):
+    '''
+    Returns the centroids of clusters with the given sums and counts. A
+    centroid without points keeps its previous position.
+    '''
+    sums = sums.copy()
+    counts = counts.copy()
+    empty = counts == 0
+    sums[empty] = previous.sums[empty]
+    counts[empty] = previous.counts[empty]
+    return Centroids(sums, counts)
+
+def lloyd_elkan(points, initial, max_iterations):
+    '''
+    Lloyd's algorithm with Elkan's assignment step. Every point keeps an
+    upper bound on the distance to its centroid and a lower bound on the
+    distance to every centroid. A distance is only computed when these
+    bounds and the distances between centroids don't prove that the
+    centroid can't be the closest one. Computed distances are exactly
+    the ones of the exhaustive assignment, and ties are still resolved
+    in favor of the first centroid.
+    '''
+    sparse = SparsePoints(points)
+    norms = point_norms(points)
+    n = len(points)
+    centroids = Centroids.from_points(points, initial)
+    k = len(centroids)
+    tolerance = np.sqrt(BOUND_TOLERANCE * (1 + 4 * norms.max(initial=0)))
+    squared = centroids.distances(point_dots(points, centroids.sums), norms)
+    assignments = squared.argmin(axis=1)
+    lower = np.sqrt(np.maximum(squared, 0))
+    upper = lower[np.arange(n), assignments]
+    skipped = [0]
+    member_sums = np.zeros_like(centroids.sums)
+    np.add.at(member_sums, assignments, points)
+    member_counts = np.bincount(assignments, minlength=k).astype(np.float64)
+    iteration = 1
+    for iteration in range(2, max_iterations + 1):
+        previous = centroids
+        centroids = positioned(member_sums, member_counts, previous)
+        drift = np.sqrt(((centroids.means - previous.means) ** 2).sum(axis=1))
+        upper = upper + drift[assignments]
+        lower = np.maximum(lower - drift, 0)
+
+        half = 0.5 * centroids.separations()
+        np.fill_diagonal(half, np.inf)
+        separation = half.min(axis=1)
+        rows = np.arange(n)
+        candidates = (upper[:, None] > lower - tolerance) & \
+                     (upper[:, None] > half[assignments] - tolerance)
+        candidates[upper <= separation[assignments] - tolerance] = False
+        active = np.flatnonzero(candidates.any(axis=1))
+
+        # Tighten the upper bound of the points that may move.
+        own = assignments[active]
+        own_squared = centroids.pair_distances(sparse.dots(centroids.sums, active, own),
+                                               norms[active], own)
+        upper[active] = np.sqrt(np.maximum(own_squared, 0))
+        lower[active, own] = upper[active]
+        candidates[active] &= (upper[active, None] > lower[active] - tolerance) & \
+                              (upper[active, None] > half[own] - tolerance)
+        pair_rows, pair_columns = np.nonzero(candidates)
+        pair_squared = centroids.pair_distances(sparse.dots(centroids.sums, pair_rows, pair_columns),
+                                                norms[pair_rows], pair_columns)
+        lower[pair_rows, pair_columns] = np.sqrt(np.maximum(pair_squared, 0))
+        skipped.append(n * k - len(active) - len(pair_rows))
+
+        computed = np.full((len(active), k), np.inf)
+        position = np.full(n, -1)
+        position[active] = np.arange(len(active))
+        computed[np.arange(len(active)), own] = own_squared
+        computed[position[pair_rows], pair_columns] = pair_squared
+        closest = assignments.copy()
+        closest[active] = computed.argmin(axis=1)
+        if np.array_equal(closest, assignments):
+            break
+        moved = np.flatnonzero(closest != assignments)
+        upper[moved] = lower[moved, closest[moved]]
+        sparse.move(member_sums, moved, assignments[moved], closest[moved])
+        member_counts += np.bincount(closest[moved], minlength=k) - \
+                         np.bincount(assignments[moved], minlength=k)
+        assignments = closest
+    rows = np.arange(n)
+    inertia = centroids.pair_distances(sparse.dots(centroids.sums, rows, assignments),
+                                       norms, assignments)
+    return KMeansResult(assignments, positioned(member_sums, member_counts, centroids).means,
+                        iteration, float(inertia.sum()), skipped)
+
+def classes(names, assignments):
+    '''
+    Returns the non-empty classes of <names>, as alphabetically sorted
+    lists, ordered by centroid index.
+    '''
+    groups = {}
+    for name, index in zip(names, assignments):
+        groups.setdefault(int(index), []).append(name)
+    return [sorted(groups[index]) for index in sorted(groups)]
+
+'''
+PARALLEL RUNS
+
+Sweeps over several k and seeds run in a process pool. The points are
+unpacked once to a temporary .npy file of uint8 that every worker maps
+read-only and passes to lloyd as is: the workers share its pages 
+instead of holding a copy of the points each.
+'''
+
+shared_points = None
+
+def load_shared(path):
+    global shared_points
+    shared_points = np.load(path, mmap_mode="r")
+
+def run_shared(run):
+    initial, max_iterations, assignment = run
+    result = lloyd(shared_points, initial, max_iterations, assignment)
+    return (result.assignments.tolist(), result.iterations, result.inertia)
+
+def sweep(bits, dimension, initials, processes=None, max_iterations=MAX_ITERATIONS,
+          assignment="exhaustive"):
+    '''
+    Runs lloyd from every list of initial point indices of <initials>
+    in a pool of <processes> worker processes (os.cpu_count() by
+    default). <bits> is the matrix of packed points (as in
+    StateVectors.bits) of dimension <dimension>.
+
+    Return value: a list with the (assignments, iterations, inertia) of
+                  every run, in the order of <initials>.
+    '''
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "points.npy")
+    try:
+        np.save(path, np.unpackbits(np.asarray(bits), axis=1)[:, :dimension])
+        runs = [(list(initial), max_iterations, assignment) for initial in initials]
+        with multiprocessing.Pool(processes, load_shared, (path,)) as pool:
+            return pool.map(run_shared, runs, chunksize=1)
+    finally:
+        os.remove(path)
+        os.rmdir(directory)
+
+'''
+DISTRIBUTED MODE
+
+For large inputs the points stay in a cached RDD of (index, ones)
+tuples, where <ones> is the sorted array of the coordinates equal to 1.
+The centroids are broadcast at every iteration and every partition
+returns the partial sums and counts of its points, which are reduced
+with treeAggregate: only k x D values reach the driver per iteration.
+'''
+
+def point_distances(centroids, ones):
+    '''
+    Returns the squared distances from the sparse point <ones> to the
+    centroids, computed as in assign.
+    '''
+    dots = centroids.sums[:, ones].sum(axis=1)
+    return centroids.distances(dots[None, :], np.array([float(len(ones))]))[0]
+
+def partial_sums(broadcast):
+    '''
+    Returns the mapPartitions function computing, for the points of a
+    partition, the sums and counts of the clusters they are assigned
+    to with the broadcast centroids, and their inertia.
+    '''
+    def partition(iterator):
+        centroids = broadcast.value
+        sums = None
+        for index, ones in iterator:
+            if sums is None:
+                sums = np.zeros_like(centroids.sums)
+                counts = np.zeros(len(centroids))
+                inertia = 0.0
+            distances = point_distances(centroids, ones)
+            closest = distances.argmin()
+            sums[closest, ones] += 1
+            counts[closest] += 1
+            inertia += distances[closest]
+        if sums is not None:
+            yield (sums, counts, inertia)
+    return partition
+
+def add_partials(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+def spark_centroids(points, initial, dimension):
+    '''
+    Returns the centroids located at the points of indices <initial> of
+    the RDD <points>.
+    '''
+    wanted = set(initial)
+    found = dict(points.filter(lambda point: point[0] in wanted).collect())
+    sums = np.zeros((len(initial), dimension))
+    for row, index in enumerate(initial):
+        sums[row, found[index]] = 1
+    return Centroids(sums, np.ones(len(initial)))
+
+def assign_spark(sc, points, centroids):
+    '''
+    Returns a dictionary mapping the index of every point of the RDD
+    <points> to the index of its closest centroid.
+    '''
+    broadcast = sc.broadcast(centroids)
+    closest = points.map(lambda point: (point[0], int(point_distances(broadcast.value, point[1]).argmin())))
+    assignments = dict(closest.collect())
+    broadcast.unpersist()
+    return assignments
+
+def lloyd_spark(sc, points, dimension, initial, max_iterations=MAX_ITERATIONS, depth=2):
+    '''
+    Runs Lloyd's algorithm on the cached RDD <points> of (index, ones)
+    tuples of dimension <dimension>, as lloyd does. The iterations stop
+    when the centroids computed from the assignments are the ones that
+    produced them, i.e. when the assignments don't change anymore.
+
+    Return value: a KMeansResult, with a dictionary mapping the index of
+                  every point to the index of its centroid as
+                  assignments.
+    '''
+    centroids = spark_centroids(points, initial, dimension)
+    for iteration in range(1, max_iterations + 1):
+        used = centroids
+        broadcast = sc.broadcast(centroids)
+        sums, counts, inertia = points.mapPartitions(partial_sums(broadcast)) \
+                                      .treeAggregate(None, add_partials, add_partials, depth)
+        broadcast.unpersist()
+        empty = counts == 0
+        sums[empty] = centroids.sums[empty]
+        counts[empty] = centroids.counts[empty]
+        if np.array_equal(counts, centroids.counts) and np.array_equal(sums, centroids.sums):
+            break
+        centroids = Centroids(sums, counts)
+    return KMeansResult(assign_spark(sc, points, used), centroids.means,
+                        iteration, float(inertia), [0] * iteration)
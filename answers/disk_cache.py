@@ -0,0 +1,106 @@
+'''
+On-disk cache of the data parsed from a data file.
+
+The cache of a file is the directory <file>.cache, next to it. Its
+meta.json records the size, modification time and SHA-1 of the file it
+was built from. A cache whose file changed size, or changed
+modification time and content, is emptied before being used again.
+
+The state vectors are stored as a packed bit matrix (incidence.npy),
+opened memory-mapped, with the plant and state names (index.json).
+'''
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from state_vectors import StateVectors
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, value):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(value, f)
+    os.replace(temporary, path)
+
+def is_valid(path, directory):
+    '''
+    Returns True if the cache <directory> was built from the current
+    content of <path>. A cache whose file was only touched is updated
+    with the new modification time.
+    '''
+    meta = read_meta(directory)
+    if meta is None:
+        return False
+    stat = os.stat(path)
+    if meta["size"] != stat.st_size:
+        return False
+    if meta["mtime_ns"] != stat.st_mtime_ns:
+        if meta["sha1"] != file_hash(path):
+            return False
+        meta["mtime_ns"] = stat.st_mtime_ns
+        write_json(os.path.join(directory, "meta.json"), meta)
+    return True
+
+def cache_directory(path):
+    '''
+    Returns the cache directory of <path>, emptied first if it is not
+    valid anymore, or None if it can't be written.
+    '''
+    directory = path + ".cache"
+    try:
+        if os.path.isdir(directory) and is_valid(path, directory):
+            return directory
+        clear(path)
+        os.mkdir(directory)
+        stat = os.stat(path)
+        write_json(os.path.join(directory, "meta.json"),
+                   {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                    "sha1": file_hash(path)})
+        return directory
+    except OSError:
+        return None
+
+def clear(path):
+    '''
+    Removes the cache directory of <path>.
+    '''
+    shutil.rmtree(path + ".cache", ignore_errors=True)
+
+def save_vectors(directory, vectors):
+    temporary = os.path.join(directory, "incidence.tmp.npy")
+    np.save(temporary, vectors.bits)
+    os.replace(temporary, os.path.join(directory, "incidence.npy"))
+    write_json(os.path.join(directory, "index.json"),
+               {"states": vectors.states, "plants": vectors.plants})
+
+def load_vectors(directory, states):
+    '''
+    Returns the StateVectors of <states> stored in <directory>, with the
+    bit matrix memory-mapped, or None if they are not stored.
+    '''
+    try:
+        with open(os.path.join(directory, "index.json")) as f:
+            index = json.load(f)
+        if index["states"] != list(states):
+            return None
+        bits = np.load(os.path.join(directory, "incidence.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return StateVectors(index["states"], index["plants"], bits)
@@ -0,0 +1,45 @@
+'''
+Dictionary encoding of items as dense integer ids.
+
+The items of the baskets are state abbreviations. They are mined as
+integers, and only decoded back to names when results are rendered.
+Ids are given in alphabetical order of the names, so that sorting ids
+sorts names: ties in the top-n orderings are broken the same way on
+encoded and on decoded rows.
+'''
+
+import all_states
+
+class Encoding:
+    '''
+    Bijection between names and the ids 0, 1, ..., len(names) - 1.
+    '''
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.ids = dict((name, i) for i, name in enumerate(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, names):
+        return [self.ids[name] for name in names]
+
+    def decode(self, ids):
+        return [self.names[i] for i in ids]
+
+    def decode_rows(self, rows):
+        '''
+        Returns <rows> with every list of ids they contain replaced by
+        the list of names.
+        '''
+        return [tuple(self.decode(value) if isinstance(value, list) else value
+                      for value in row)
+                for row in rows]
+
+def item_encoding(items):
+    '''
+    Returns the Encoding of the states of all_states and of the other
+    items of <items>.
+    '''
+    return Encoding(sorted(set(all_states.all_states).union(items)))
@@ -0,0 +1,190 @@
+'''
+Opt-in instrumentation of the pipeline stages of answer.py.
+
+The stages of the pipelines are functions decorated with @instrumented
+or blocks wrapped in `with stage(name):`. Once enable is called, every
+stage records:
+- elapsed: its wall time, in seconds;
+- jobs: the number of Spark jobs it triggered (including the ones of
+  its sub-stages). Every stage runs its jobs in its own job group,
+  whose jobs are counted with the status tracker of the SparkContext;
+- rows: the number of rows it produced, when it reports them with rows;
+- caches: the hits and misses of the caches it looked up, reported
+  with cache;
+- stages: the records of its sub-stages.
+
+When the outermost stage of a call ends, its record becomes available
+from report() and is appended as a JSON line to the log file given to
+enable, if any. While instrumentation is disabled, stages only cost a
+function call.
+'''
+
+import json
+import time
+import functools
+import itertools
+import threading
+import contextlib
+
+ENABLED = False
+LOG_PATH = None
+
+# Milliseconds to wait for the Spark listeners to see the jobs of a
+# stage before counting them.
+LISTENER_TIMEOUT = 10000
+
+state = threading.local()
+group_ids = itertools.count()
+last_report = None
+
+def no_spark_context():
+    return None
+
+spark_context = no_spark_context
+
+def set_spark_context(function):
+    '''
+    Sets the function returning the active SparkContext, or None if
+    Spark is not started. Stages never start Spark themselves.
+    '''
+    global spark_context
+    spark_context = function
+
+def enable(log_path=None):
+    '''
+    Enables instrumentation. The report of every call is appended to
+    the file <log_path>, if it is not None.
+    '''
+    global ENABLED, LOG_PATH
+    ENABLED = True
+    LOG_PATH = log_path
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def report():
+    '''
+    Returns the record of the last instrumented call, as a dictionary,
+    or None.
+    '''
+    return last_report
+
+class Record:
+
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = 0.0
+        self.jobs = 0
+        self.rows = None
+        self.caches = {}
+        self.stages = []
+        self.group = None
+        self.previous_group = None
+        self.context = None
+
+    def as_dict(self):
+        return {"name": self.name, "elapsed": self.elapsed, "jobs": self.jobs,
+                "rows": self.rows, "caches": self.caches,
+                "stages": [record.as_dict() for record in self.stages]}
+
+def current():
+    stack = getattr(state, "stack", None)
+    return stack[-1] if stack else None
+
+def rows(count):
+    '''
+    Adds <count> to the rows produced by the current stage.
+    '''
+    record = current()
+    if record is not None:
+        record.rows = (record.rows or 0) + count
+
+def cache(name, hit):
+    '''
+    Counts a hit (<hit> is True) or a miss of the cache <name> in the
+    current stage.
+    '''
+    record = current()
+    if record is not None:
+        counts = record.caches.setdefault(name, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+def wait_for_listeners(sc):
+    try:
+        sc._jsc.sc().listenerBus().waitUntilEmpty(LISTENER_TIMEOUT)
+    except Exception:
+        time.sleep(0.1)
+
+def start_jobs(record):
+    sc = spark_context()
+    if sc is None:
+        return
+    record.context = sc
+    record.previous_group = (sc.getLocalProperty("spark.jobGroup.id"),
+                             sc.getLocalProperty("spark.job.description"))
+    record.group = "instrumentation-{0}".format(next(group_ids))
+    sc.setLocalProperty("spark.jobGroup.id", record.group)
+    sc.setLocalProperty("spark.job.description", record.name)
+
+def end_jobs(record):
+    '''
+    Counts the jobs run by <record> itself: the jobs of its group, or,
+    if Spark was started during the stage, the jobs without a group not
+    counted yet by another stage.
+    '''
+    sc = spark_context()
+    if sc is None:
+        return 0
+    wait_for_listeners(sc)
+    tracker = sc.statusTracker()
+    if record.group is not None and record.context is sc:
+        jobs = len(tracker.getJobIdsForGroup(record.group))
+        sc.setLocalProperty("spark.jobGroup.id", record.previous_group[0])
+        sc.setLocalProperty("spark.job.description", record.previous_group[1])
+        return jobs
+    ungrouped = len(tracker.getJobIdsForGroup(None))
+    counted = getattr(state, "ungrouped", {}).get(sc.applicationId, 0)
+    state.ungrouped = {sc.applicationId: ungrouped}
+    return ungrouped - counted
+
+@contextlib.contextmanager
+def stage(name):
+    '''
+    Records the execution of the block as the stage <name>.
+    '''
+    if not ENABLED:
+        yield
+        return
+    global last_report
+    record = Record(name)
+    parent = current()
+    if parent is None:
+        state.stack = []
+    else:
+        parent.stages.append(record)
+    state.stack.append(record)
+    start_jobs(record)
+    start = time.time()
+    try:
+        yield record
+    finally:
+        record.elapsed = time.time() - start
+        record.jobs += end_jobs(record) + sum(child.jobs for child in record.stages)
+        state.stack.pop()
+        if parent is None:
+            last_report = record.as_dict()
+            if LOG_PATH is not None:
+                with open(LOG_PATH, "a") as f:
+                    f.write(json.dumps(last_report) + "\n")
+
+def instrumented(function):
+    '''
+    Decorator recording every call of <function> as a stage named after
+    it.
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with stage(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,253 @@
+'''
+Frequent itemsets and association rules computed in Python.
+
+Itemsets are frozensets of items. A dictionary mapping every frequent
+itemset to its frequency (the number of baskets containing it) is
+enough to derive the association rules and their interest, in the
+format produced by Spark's FP-Growth:
+
+- the items of an itemset are ordered by increasing frequency (then by
+  name), like in FP-Growth's output;
+- rules have a single item as consequent.
+'''
+
+import heapq
+import math
+
+def min_count(s, count):
+    '''
+    Returns the minimal frequency of an itemset of support <s> in
+    <count> baskets, computed as FP-Growth does.
+    '''
+    return int(math.ceil(s * count))
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bits):
+        return bin(bits).count("1")
+
+def tidsets(baskets):
+    '''
+    Returns a dictionary mapping every item of <baskets> (a list of item
+    lists) to the set of baskets containing it, as an integer whose bit
+    i is set if the item is in basket i.
+    '''
+    positions = {}
+    for i, basket in enumerate(baskets):
+        for item in set(basket):
+            positions.setdefault(item, []).append(i)
+    size = (len(baskets) + 7) // 8
+    result = {}
+    for item, indices in positions.items():
+        bits = bytearray(size)
+        for i in indices:
+            bits[i >> 3] |= 1 << (i & 7)
+        result[item] = int.from_bytes(bytes(bits), "little")
+    return result
+
+def mine(baskets, s):
+    '''
+    Returns a dictionary mapping every frequent itemset (frozenset) of
+    <baskets>, a list of item lists, with min support <s> to its
+    frequency. Itemsets are enumerated depth first by intersecting the
+    bitsets of the baskets containing them (Eclat).
+    '''
+    threshold = min_count(s, len(baskets))
+    frequent = []
+    for item, bits in tidsets(baskets).items():
+        freq = popcount(bits)
+        if freq >= threshold:
+            frequent.append((freq, item, bits))
+    frequent.sort()
+    supports = {}
+    stack = [(frozenset(), [(item, bits, freq) for freq, item, bits in frequent])]
+    while stack:
+        prefix, extensions = stack.pop()
+        for i, (item, bits, freq) in enumerate(extensions):
+            itemset = prefix | frozenset([item])
+            supports[itemset] = freq
+            children = []
+            for other, other_bits, other_freq in extensions[i + 1:]:
+                both = bits & other_bits
+                both_freq = popcount(both)
+                if both_freq >= threshold:
+                    children.append((other, both, both_freq))
+            if children:
+                stack.append((itemset, children))
+    return supports
+
+def count_itemsets(baskets, itemsets):
+    '''
+    Returns a dictionary mapping every itemset of <itemsets> to the
+    number of baskets of <baskets> (an iterable of item lists)
+    containing it.
+    '''
+    counts = dict.fromkeys(itemsets, 0)
+    for basket in baskets:
+        basket = set(basket)
+        for itemset in counts:
+            if itemset <= basket:
+                counts[itemset] += 1
+    return counts
+
+def chunks(baskets, size):
+    '''
+    Yields the baskets of the iterable <baskets> in lists of at most 
+    <size> baskets, holding at most 2 x <size> of them. A short last 
+    chunk is merged with the previous one and the result split in two 
+    halves, so every chunk has at least <size> / 2 baskets (rounded 
+    down) unless there are fewer than <size> baskets.
+    '''
+    chunk = []
+    for basket in baskets:
+        chunk.append(basket)
+        if len(chunk) == 2 * size:
+            yield chunk[:size]
+            chunk = chunk[size:]
+    if len(chunk) > size:
+        half = len(chunk) // 2
+        yield chunk[:half]
+        chunk = chunk[half:]
+    if chunk:
+        yield chunk
+
+def count_tidsets(baskets, itemsets):
+    '''
+    Same as count_itemsets, for a list of <baskets>, by intersecting the
+    bitsets of the baskets containing the items.
+    '''
+    bits = tidsets(baskets)
+    counts = {}
+    for itemset in itemsets:
+        common = -1
+        for item in itemset:
+            common &= bits.get(item, 0)
+        counts[itemset] = len(baskets) if common == -1 else popcount(common)
+    return counts
+
+def son_candidates(chunks, s):
+    '''
+    Returns the set of the itemsets frequent with min support <s> in at 
+    least one list of baskets of <chunks> (first pass of the SON 
+    algorithm). An itemset frequent in all the baskets is frequent in 
+    at least one chunk, so the candidates contain all of them.
+    '''
+    candidates = set()
+    for chunk in chunks:
+        candidates.update(mine(chunk, s))
+    return candidates
+
+def apriori_gen(level, frequent):
+    '''
+    Returns the unions of two itemsets of <level>, all of size k, 
+    sharing k - 1 items, whose subsets of size k are all in <frequent> 
+    (the candidates of size k + 1 of Apriori).
+    '''
+    prefixes = {}
+    for itemset in level:
+        itemset = tuple(sorted(itemset))
+        prefixes.setdefault(itemset[:-1], []).append(itemset[-1])
+    candidates = set()
+    for prefix, lasts in prefixes.items():
+        lasts.sort()
+        for i, a in enumerate(lasts):
+            for b in lasts[i + 1:]:
+                union = frozenset(prefix + (a, b))
+                if all(union - frozenset([item]) in frequent for item in union):
+                    candidates.add(union)
+    return candidates
+
+def negative_border(frequent, items):
+    '''
+    Returns the negative border of <frequent>, a set of itemsets closed 
+    under subsets: the itemsets that are not in <frequent> while all 
+    their subsets are, i.e. the items of <items> not in <frequent> and 
+    the candidates of apriori_gen not in <frequent>.
+    '''
+    border = set(frozenset([item]) for item in items) - frequent
+    levels = {}
+    for itemset in frequent:
+        levels.setdefault(len(itemset), []).append(itemset)
+    for level in levels.values():
+        border.update(apriori_gen(level, frequent) - frequent)
+    return border
+
+def toivonen_candidates(sample, s, items, lowering=0.8):
+    '''
+    Returns the itemsets frequent with min support <s> * <lowering> in 
+    the list of baskets <sample>, and their negative border (see 
+    negative_border). If no itemset of the border is frequent in all 
+    the baskets, the frequent itemsets are among the first ones 
+    (Toivonen's algorithm).
+    '''
+    frequent = set(mine(sample, s * lowering))
+    return frequent, negative_border(frequent, items)
+
+def item_ranks(supports):
+    '''
+    Returns a dictionary mapping every frequent item of <supports> to
+    its position in itemsets: by increasing frequency, then by name.
+    '''
+    singles = sorted((freq, item) for itemset, freq in supports.items()
+                     if len(itemset) == 1 for item in itemset)
+    return dict((item, rank) for rank, (freq, item) in enumerate(singles))
+
+def ordered(itemset, ranks):
+    return sorted(itemset, key=ranks.__getitem__)
+
+def itemset_rows(supports):
+    '''
+    Returns the (items, freq) rows of the itemsets of <supports>.
+    '''
+    ranks = item_ranks(supports)
+    return [(ordered(itemset, ranks), freq) for itemset, freq in supports.items()]
+
+def rule_rows(supports, c):
+    '''
+    Returns the (antecedent, consequent, confidence) rows of the
+    association rules of confidence at least <c> derived from the
+    itemsets of <supports>.
+    '''
+    ranks = item_ranks(supports)
+    rows = []
+    for itemset, freq in supports.items():
+        if len(itemset) < 2:
+            continue
+        for item in itemset:
+            antecedent = itemset - frozenset([item])
+            confidence = freq / supports[antecedent]
+            if confidence >= c:
+                rows.append((ordered(antecedent, ranks), [item], confidence))
+    return rows
+
+def interest_rows(supports, c, total_count):
+    '''
+    Returns the (antecedent, consequent, confidence, items, freq,
+    interest) rows of the association rules of confidence at least
+    <c>, where <items> is the consequent and <freq> its frequency among
+    <total_count> baskets.
+    '''
+    rows = []
+    for antecedent, consequent, confidence in rule_rows(supports, c):
+        freq = supports[frozenset(consequent)]
+        interest = abs(confidence - (freq / total_count))
+        rows.append((antecedent, consequent, confidence, consequent, freq, interest))
+    return rows
+
+def top_rows(rows, n, keys):
+    '''
+    Returns the first <n> rows of <rows> sorted by <keys>(row), ties
+    being broken by the row values in ascending order, like answer.top_n.
+    '''
+    return heapq.nsmallest(n, rows, key=lambda row: (keys(row), row))
+
+def top_itemsets(supports, n):
+    return top_rows(itemset_rows(supports), n, lambda row: (-len(row[0]), -row[1]))
+
+def top_rules(supports, n, c):
+    return top_rows(rule_rows(supports, c), n, lambda row: (-len(row[0]), -row[2]))
+
+def top_interests(supports, n, c, total_count):
+    return top_rows(interest_rows(supports, c, total_count), n,
+                    lambda row: (-len(row[0]), -row[5]))
@@ -0,0 +1,138 @@
+'''
+Packed state vectors for the clustering part of the assignment.
+
+A state vector has one binary component per plant. Instead of one
+dictionary per state, the plants are stored once in a sorted index and
+every state is a row of bits in a uint8 matrix (8 plants per byte,
+as produced by numpy.packbits).
+'''
+
+import numpy as np
+
+# Number of bits set in every byte value.
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Upper bound on the size of the XOR blocks built by pairwise_popcount.
+BLOCK_BYTES = 1 << 24
+
+def popcount(bits, axis=-1):
+    '''
+    Returns the number of bits set in the uint8 array <bits> along
+    <axis>.
+    '''
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=axis, dtype=np.int64)
+    return POPCOUNT[bits].sum(axis=axis, dtype=np.int64)
+
+def pairwise_popcount(a, b):
+    '''
+    Returns the matrix of the number of differing bits between every 
+    row of <a> and every row of <b> (two packed uint8 matrices with the
+    same number of columns), i.e. their squared Euclidean distances.
+    The rows of <a> are processed in blocks to bound memory.
+    '''
+    out = np.empty((a.shape[0], b.shape[0]), dtype=np.int64)
+    rows = max(1, BLOCK_BYTES // max(1, b.shape[0] * b.shape[1]))
+    for start in range(0, a.shape[0], rows):
+        block = a[start:start + rows, None, :] ^ b[None, :, :]
+        out[start:start + rows] = popcount(block)
+    return out
+
+class StateVectors:
+    '''
+    Binary state vectors sharing a sorted plant index.
+
+    - states: the state names, in the order of the rows of <bits>.
+    - plants: the plant names, sorted alphabetically. Plant i is bit i
+      of every row.
+    - bits: a uint8 matrix with one row of ceil(len(plants) / 8) bytes
+      per state.
+    '''
+
+    def __init__(self, states, plants, bits):
+        self.states = list(states)
+        self.plants = list(plants)
+        self.bits = bits
+        self.state_index = dict((state, i) for i, state in enumerate(self.states))
+        self.plant_index = dict((plant, i) for i, plant in enumerate(self.plants))
+        self.distances = None
+
+    @classmethod
+    def from_groups(cls, states, plants, plants_by_state):
+        '''
+        Builds the vectors of <states> from <plants>, the list of all
+        plant names, and <plants_by_state>, a dictionary mapping a
+        state to the plants found in it. States missing from the
+        dictionary get an empty vector.
+        '''
+        plants = sorted(set(plants))
+        plant_index = dict((plant, i) for i, plant in enumerate(plants))
+        bits = np.zeros((len(states), (len(plants) + 7) // 8), dtype=np.uint8)
+        for row, state in enumerate(states):
+            columns = np.array([plant_index[plant] for plant in plants_by_state.get(state, [])],
+                               dtype=np.int64)
+            np.bitwise_or.at(bits[row], columns >> 3,
+                             (0x80 >> (columns & 7)).astype(np.uint8))
+        return cls(states, plants, bits)
+
+    @property
+    def dimension(self):
+        return len(self.plants)
+
+    def row(self, state):
+        return self.bits[self.state_index[state]]
+
+    def contains(self, state, plant):
+        '''
+        Returns True if <plant> occurs in <state>, False otherwise
+        (including for unknown states and plants).
+        '''
+        if state not in self.state_index or plant not in self.plant_index:
+            return False
+        i = self.plant_index[plant]
+        return bool(self.row(state)[i >> 3] & (0x80 >> (i & 7)))
+
+    def vector(self, state):
+        '''
+        Returns the 0/1 vector of <state> as a uint8 array.
+        '''
+        return np.unpackbits(self.row(state))[:self.dimension]
+
+    def dense(self):
+        '''
+        Returns the (states x plants) 0/1 matrix as a uint8 array.
+        '''
+        return np.unpackbits(self.bits, axis=1)[:, :self.dimension]
+
+    def as_dict(self, state):
+        '''
+        Returns the vector of <state> as a dictionary mapping every
+        plant name to 0 or 1.
+        '''
+        return dict(zip(self.plants, self.vector(state).tolist()))
+
+    def distance_matrix(self):
+        '''
+        Returns the (states x states) matrix of squared distances. It is
+        computed on the first call and kept for the next ones.
+        '''
+        if self.distances is None:
+            self.distances = pairwise_popcount(self.bits, self.bits)
+        return self.distances
+
+    def pairwise_distances(self, states_a, states_b):
+        '''
+        Returns the matrix of squared distances between every state of
+        <states_a> (rows) and every state of <states_b> (columns).
+        '''
+        rows = [self.state_index[state] for state in states_a]
+        columns = [self.state_index[state] for state in states_b]
+        return self.distance_matrix()[np.ix_(rows, columns)]
+
+    def distance2(self, state1, state2):
+        '''
+        Returns the squared Euclidean distance between two states, i.e.
+        the number of plants found in only one of them.
+        '''
+        matrix = self.distance_matrix()
+        return int(matrix[self.state_index[state1], self.state_index[state2]])
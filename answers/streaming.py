@@ -0,0 +1,203 @@
+'''
+Kmeans clusters of states maintained while new baskets arrive.
+
+A StreamingKMeans is built from the state vectors and the assignments
+of a kmeans run, and saved to a single .npz file. New basket lines
+(plant, state, state, ...) are then applied in mini-batches:
+- the plants seen for the first time are appended to the plant index;
+- the vectors of the states that gained a plant are updated, and so
+  are the sums of their clusters;
+- only these states are assigned again, and a state that changes
+  cluster is moved from the sums of its old cluster to the new one.
+
+A batch costs O(k x number of plants of the touched states): the
+states not touched by a batch keep their cluster until they are, or
+until kmeans is run again on the whole file.
+
+Centroids are kept as in clustering.Centroids, as the sums of the
+vectors of their states and their counts, here in integers, with the
+squared norms of the sums. Distances are compared as exact fractions,
+and a state stays in its cluster in case of ties.
+'''
+
+import os
+from fractions import Fraction
+
+import numpy as np
+
+import clustering
+
+# Initial number of plant columns of the cluster sums. The columns are
+# doubled when new plants don't fit.
+MIN_CAPACITY = 1024
+
+class StreamingKMeans:
+    '''
+    - states: the state names.
+    - plants: the plant names; plant i is coordinate i. The plants of
+      the initial vectors are sorted alphabetically, new plants are
+      appended.
+    - members: for every state, the set of the coordinates of its
+      plants.
+    - assignments: the cluster of every state.
+    - sums, counts: for every cluster, the sum of the vectors of its
+      states and their number.
+    '''
+
+    def __init__(self, states, plants, members, assignments, sums, counts):
+        self.states = list(states)
+        self.plants = list(plants)
+        self.state_index = dict((state, i) for i, state in enumerate(self.states))
+        self.plant_index = dict((plant, i) for i, plant in enumerate(self.plants))
+        self.members = [set(int(i) for i in plant_ids) for plant_ids in members]
+        self.assignments = np.array(assignments, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.sums = np.zeros((len(self.counts), max(MIN_CAPACITY, len(self.plants))),
+                             dtype=np.int64)
+        self.sums[:, :len(self.plants)] = sums
+        self.squares = (self.sums * self.sums).sum(axis=1)
+
+    @classmethod
+    def from_vectors(cls, vectors, assignments, k):
+        '''
+        Builds the clusters of the StateVectors <vectors>, where state i
+        belongs to cluster <assignments>[i] among <k>.
+        '''
+        members = [np.flatnonzero(np.unpackbits(row)[:vectors.dimension])
+                   for row in vectors.bits]
+        sums = np.zeros((k, vectors.dimension), dtype=np.int64)
+        for plant_ids, cluster in zip(members, assignments):
+            sums[cluster, plant_ids] += 1
+        counts = np.bincount(np.asarray(assignments, dtype=np.int64), minlength=k)
+        return cls(vectors.states, vectors.plants, members, assignments, sums, counts)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            indptr = data["indptr"]
+            members = [data["indices"][indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)]
+            return cls(data["states"].tolist(), data["plants"].tolist(), members,
+                       data["assignments"], data["sums"], data["counts"])
+
+    def save(self, path):
+        '''
+        Writes the clusters to the .npz file <path>, atomically.
+        '''
+        members = [np.array(sorted(plant_ids), dtype=np.int64) for plant_ids in self.members]
+        indptr = np.concatenate([[0], np.cumsum([len(plant_ids) for plant_ids in members])])
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, states=np.array(self.states), plants=np.array(self.plants),
+                     indptr=indptr.astype(np.int64),
+                     indices=np.concatenate(members + [np.zeros(0, dtype=np.int64)]),
+                     assignments=self.assignments, counts=self.counts,
+                     sums=self.sums[:, :len(self.plants)])
+        os.replace(temporary, path)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def classes(self):
+        return clustering.classes(self.states, self.assignments)
+
+    def plant_id(self, plant):
+        '''
+        Returns the coordinate of <plant>, appending it to the plant
+        index if it is new.
+        '''
+        index = self.plant_index.get(plant)
+        if index is None:
+            index = len(self.plants)
+            if index == self.sums.shape[1]:
+                self.sums = np.concatenate([self.sums, np.zeros_like(self.sums)], axis=1)
+            self.plants.append(plant)
+            self.plant_index[plant] = index
+        return index
+
+    def observe(self, pairs):
+        '''
+        Adds the (plant, state) observations of <pairs> to the state
+        vectors and to the sums of their clusters. Unknown states are
+        ignored. Returns the indices of the states that changed.
+        '''
+        touched = set()
+        for plant, state in pairs:
+            row = self.state_index.get(state)
+            if row is None:
+                continue
+            column = self.plant_id(plant)
+            if column in self.members[row]:
+                continue
+            self.members[row].add(column)
+            cluster = self.assignments[row]
+            self.squares[cluster] += 2 * self.sums[cluster, column] + 1
+            self.sums[cluster, column] += 1
+            touched.add(row)
+        return touched
+
+    def closest(self, row):
+        '''
+        Returns the cluster closest to the state <row>, its current one
+        in case of ties, and the dot products between the state and the
+        cluster sums.
+        '''
+        plant_ids = np.fromiter(self.members[row], dtype=np.int64, count=len(self.members[row]))
+        dots = self.sums[:, plant_ids].sum(axis=1)
+        norm = len(plant_ids)
+        current = int(self.assignments[row])
+        best, best_distance = current, None
+        for cluster in [current] + list(range(len(self))):
+            count = int(self.counts[cluster])
+            if count == 0:
+                continue
+            distance = Fraction(norm * count * count - 2 * int(dots[cluster]) * count
+                                + int(self.squares[cluster]), count * count)
+            if best_distance is None or distance < best_distance:
+                best, best_distance = cluster, distance
+        return best, dots
+
+    def move(self, row, target, dots):
+        plant_ids = np.fromiter(self.members[row], dtype=np.int64, count=len(self.members[row]))
+        source = self.assignments[row]
+        norm = len(plant_ids)
+        self.squares[source] += norm - 2 * dots[source]
+        self.squares[target] += norm + 2 * dots[target]
+        self.sums[source, plant_ids] -= 1
+        self.sums[target, plant_ids] += 1
+        self.counts[source] -= 1
+        self.counts[target] += 1
+        self.assignments[row] = target
+
+    def update(self, pairs):
+        '''
+        Applies a mini-batch of (plant, state) observations and assigns
+        the states they touched again.
+
+        Return value: the list of the (state, old cluster, new cluster)
+                      tuples of the states that changed cluster.
+        '''
+        changes = []
+        for row in sorted(self.observe(pairs)):
+            target, dots = self.closest(row)
+            source = int(self.assignments[row])
+            if target != source:
+                self.move(row, target, dots)
+                changes.append((self.states[row], source, target))
+        return changes
+
+    def update_lines(self, lines):
+        '''
+        Same as update, with the observations of basket lines in the
+        format of the data files.
+        '''
+        return self.update(pairs(lines))
+
+def pairs(lines):
+    '''
+    Returns the (plant, state) pairs of the basket <lines>.
+    '''
+    result = []
+    for line in lines:
+        fields = line.rstrip("\r\n").split(",")
+        result.extend((fields[0], state) for state in fields[1:])
+    return result
@@ -0,0 +1,263 @@
+'''
+Benchmarks of the public functions of answers/answer.py on synthetic
+data (see synthetic.py).
+
+Every function is run in its own Python process, on a file scaled
+1x to 1000x in baskets and items, and the results are written to a
+JSON file:
+- wall_time: the duration of every call, in seconds (the first call
+  includes starting Spark and parsing the file);
+- jobs, stages, shuffle_read_bytes, shuffle_write_bytes: the Spark
+  jobs run by every call in any job group, their completed stages, and
+  the bytes they read and wrote in shuffles (from the REST API of the
+  Spark UI, None if it is disabled);
+- driver_peak_rss, jvm_peak_rss: the peak resident memory of the
+  Python driver and of the JVM, in bytes (None if unknown);
+- report: the stages recorded by answers/instrumentation.py for every
+  call.
+
+Usage:
+    python benchmarks/benchmark.py run --scales 1 10 100 --output new.json
+    python benchmarks/benchmark.py compare old.json new.json
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "answers"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+# Arguments of the benchmarked functions, after the file name (the
+# values used by the tests).
+CALLS = {
+    "data_frame": (11,),
+    "frequent_itemsets": (15, 0.1, 0.3),
+    "association_rules": (15, 0.1, 0.3),
+    "interests": (15, 0.1, 0.3),
+    "data_preparation": ("urtica", "qc"),
+    "distance2": ("qc", "on"),
+    "first_iter": (3, 123),
+    "kmeans": (10, 123),
+}
+
+FUNCTIONS = ["data_frame", "frequent_itemsets", "association_rules", "interests",
+             "data_preparation", "distance2", "first_iter", "kmeans"]
+
+def peak_rss():
+    '''
+    Returns the peak resident memory of the current process, in bytes.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def process_peak_rss(pid):
+    '''
+    Returns the peak resident memory of the process <pid>, in bytes, or
+    None if it can't be read (it is only read from /proc).
+    '''
+    try:
+        with open("/proc/{0}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def rest(sc, endpoint):
+    '''
+    Returns the records of the REST API <endpoint> of the application,
+    or None if the UI is disabled.
+    '''
+    from urllib.request import urlopen
+    if not sc.uiWebUrl:
+        return None
+    url = "{0}/api/v1/applications/{1}/{2}".format(sc.uiWebUrl, sc.applicationId, endpoint)
+    try:
+        with urlopen(url) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def spark_jobs(sc):
+    '''
+    Returns a dictionary mapping the ids of all the jobs of the
+    application, whatever their job group, to their stage ids, or None
+    if the UI is disabled.
+    '''
+    import instrumentation
+    tracker = sc.statusTracker()
+    while tracker.getActiveJobIds():
+        time.sleep(0.05)
+    instrumentation.wait_for_listeners(sc)
+    jobs = rest(sc, "jobs")
+    if jobs is None:
+        return None
+    return dict((job["jobId"], job["stageIds"]) for job in jobs)
+
+def job_metrics(sc, jobs):
+    '''
+    Returns the number of <jobs> (a dictionary mapping job ids to their
+    stage ids), of their completed stages and their shuffle bytes. The
+    UI listener is updated asynchronously, so the metrics are read a
+    few times until they are stable.
+    '''
+    stage_ids = set(stage for stages in jobs.values() for stage in stages)
+    result = {"jobs": len(jobs), "stages": None,
+              "shuffle_read_bytes": None, "shuffle_write_bytes": None}
+    previous = None
+    for attempt in range(20):
+        stages = rest(sc, "stages")
+        if stages is None:
+            return result
+        completed = [stage for stage in stages
+                     if stage["status"] == "COMPLETE" and stage["stageId"] in stage_ids]
+        current = (len(completed),
+                   sum(stage["shuffleReadBytes"] for stage in completed),
+                   sum(stage["shuffleWriteBytes"] for stage in completed))
+        if current == previous:
+            break
+        previous = current
+        time.sleep(0.1)
+    result["stages"], result["shuffle_read_bytes"], result["shuffle_write_bytes"] = previous
+    return result
+
+def measure(function, filename, repeat):
+    '''
+    Calls <function> of answer.py on <filename> <repeat> times and
+    returns its measurements. The Spark metrics are only collected if
+    the function started Spark.
+    '''
+    import answer
+    import instrumentation
+    instrumentation.enable()
+    runs = []
+    jobs = {}
+    for i in range(repeat):
+        start = time.time()
+        getattr(answer, function)(filename, *CALLS[function])
+        run = {"wall_time": time.time() - start, "jobs": 0, "stages": 0,
+               "shuffle_read_bytes": 0, "shuffle_write_bytes": 0,
+               "report": instrumentation.report()}
+        if answer.spark_session is not None:
+            sc = answer.spark_context()
+            all_jobs = spark_jobs(sc)
+            if all_jobs is None:
+                run.update({"jobs": None, "stages": None,
+                            "shuffle_read_bytes": None, "shuffle_write_bytes": None})
+            else:
+                run.update(job_metrics(sc, dict((job, stages) for job, stages in all_jobs.items()
+                                                if job not in jobs)))
+                jobs = all_jobs
+        runs.append(run)
+    result = {"runs": runs, "driver_peak_rss": peak_rss(), "jvm_peak_rss": None}
+    if answer.spark_session is not None:
+        process = getattr(answer.spark_context()._gateway, "proc", None)
+        if process is not None:
+            result["jvm_peak_rss"] = process_peak_rss(process.pid)
+    return result
+
+def run_function(function, filename, repeat, warm_cache):
+    '''
+    Measures <function> on <filename> in a new Python process.
+    '''
+    if not warm_cache:
+        import disk_cache
+        disk_cache.clear(filename)
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    try:
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), "measure",
+                               function, filename, output, "--repeat", str(repeat)],
+                              cwd=ROOT)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+def run(args):
+    results = []
+    for scale in args.scales:
+        for item_scale in args.item_scales:
+            filename = synthetic.scaled_file(args.data, args.workdir, scale, item_scale, args.seed)
+            baskets = len(synthetic.read_lines(filename))
+            for function in args.functions:
+                print("{0} (baskets x{1}, items x{2})".format(function, scale, item_scale),
+                      file=sys.stderr)
+                result = {"function": function, "scale": scale, "item_scale": item_scale,
+                          "baskets": baskets, "arguments": list(CALLS[function])}
+                result.update(run_function(function, filename, args.repeat, args.warm_cache))
+                results.append(result)
+    import pyspark
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "spark": pyspark.__version__,
+              "platform": platform.platform(), "cpus": os.cpu_count(),
+              "data": args.data, "seed": args.seed, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+def compare(args):
+    '''
+    Prints the ratio of the median wall times of every function in
+    <args.new> over <args.old>.
+    '''
+    def medians(path):
+        with open(path) as f:
+            results = json.load(f)["results"]
+        times = {}
+        for result in results:
+            walls = sorted(run["wall_time"] for run in result["runs"])
+            key = (result["function"], result["scale"], result["item_scale"])
+            times[key] = walls[len(walls) // 2]
+        return times
+    old, new = medians(args.old), medians(args.new)
+    for key in sorted(set(old) & set(new)):
+        print("{0:20} x{1:<5} x{2:<5} {3:10.3f}s {4:10.3f}s {5:7.2f}".format(
+            key[0], key[1], key[2], old[key], new[key], new[key] / old[key]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command")
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--data", default=os.path.join(ROOT, "data", "plants.data"))
+    run_parser.add_argument("--workdir", default=os.path.join(ROOT, "benchmarks", "data"))
+    run_parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    run_parser.add_argument("--item-scales", type=int, nargs="+", default=[1])
+    run_parser.add_argument("--functions", nargs="+", choices=FUNCTIONS, default=FUNCTIONS)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--warm-cache", action="store_true",
+                            help="keep the on-disk cache of the data files")
+    run_parser.add_argument("--output", default="benchmark.json")
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    measure_parser = commands.add_parser("measure")
+    measure_parser.add_argument("function", choices=FUNCTIONS)
+    measure_parser.add_argument("filename")
+    measure_parser.add_argument("output")
+    measure_parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        compare(args)
+    elif args.command == "measure":
+        result = measure(args.function, args.filename, args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
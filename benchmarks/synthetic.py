@@ -0,0 +1,55 @@
+'''
+Synthetic basket files with the item distribution of plants.data.
+
+A file scaled <baskets> times in baskets and <items> times in items is
+made of <baskets> copies of every line of the source file:
+- copy r of the plant "abelia" is the plant "abelia r" (copy 0 keeps
+  its name), so the number of plants grows like the number of baskets;
+- with <items> > 1, every copy of a basket draws one of <items> copies
+  of the item space (e.g. "qc", "qc1", "qc2", ...) and renames all its
+  items to that copy. The basket sizes, the relative item frequencies
+  and the co-occurrences of the source are kept, while the number of
+  distinct items grows <items> times.
+
+Only the first copy of the item space contains the state names, so the
+clustering functions see the scaled plants but the same states.
+'''
+
+import os
+import random
+
+def read_lines(path):
+    with open(path, "rb") as f:
+        return [line for line in f.read().splitlines() if line]
+
+def generate(source, output, baskets=1, items=1, seed=0):
+    '''
+    Writes to <output> the synthetic version of <source> scaled
+    <baskets> times in baskets and <items> times in items. Returns the
+    number of baskets written.
+    '''
+    rng = random.Random(seed)
+    lines = [line.split(b",") for line in read_lines(source)]
+    temporary = output + ".tmp"
+    with open(temporary, "wb") as f:
+        for copy in range(baskets):
+            for fields in lines:
+                plant = fields[0] if copy == 0 else fields[0] + b" " + str(copy).encode()
+                space = rng.randrange(items)
+                suffix = b"" if space == 0 else str(space).encode()
+                f.write(b",".join([plant] + [item + suffix for item in fields[1:]]) + b"\n")
+    os.replace(temporary, output)
+    return baskets * len(lines)
+
+def scaled_file(source, directory, baskets=1, items=1, seed=0):
+    '''
+    Returns the path of the synthetic version of <source> in
+    <directory>, generating it if it does not exist yet.
+    '''
+    name = os.path.splitext(os.path.basename(source))[0]
+    path = os.path.join(directory, "{0}-b{1}-i{2}-s{3}.data".format(name, baskets, items, seed))
+    if not os.path.exists(path):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        generate(source, path, baskets, items, seed)
+    return path
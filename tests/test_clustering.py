@@ -0,0 +1,37 @@
+import sys
+sys.path.insert(0, './answers')
+import clustering
+
+points = [[1, 1, 0, 0], [1, 1, 1, 0], [0, 0, 1, 1], [0, 0, 0, 1], [1, 0, 0, 0]]
+
+def test_lloyd():
+    a = clustering.lloyd(points, [0, 1])
+    assert(a.assignments.tolist() == [0, 1, 1, 0, 0])
+    assert(abs(a.inertia - 3.5) < 1e-9)
+    a = clustering.lloyd(points, [4, 3])
+    assert(clustering.classes("abcde", a.assignments) == [["a", "b", "e"], ["c", "d"]])
+    assert(a.iterations == 2)
+    assert(abs(a.inertia - 11 / 6) < 1e-9)
+
+def test_point_distances():
+    a = clustering.Centroids.from_points(clustering.np.array(points, dtype=float), [0, 2])
+    assert(clustering.point_distances(a, [0, 1, 2]).tolist() == [1, 3])
+
+def test_lloyd_elkan():
+    random = clustering.np.random.RandomState(3)
+    many = (random.rand(60, 30) < 0.3).astype(float)
+    for k in [1, 4, 9]:
+        a = clustering.lloyd(many, list(range(k)))
+        b = clustering.lloyd(many, list(range(k)), assignment="elkan")
+        assert(a.assignments.tolist() == b.assignments.tolist())
+        assert(a.iterations == b.iterations)
+        assert(a.inertia == b.inertia)
+        assert(len(b.skipped) == b.iterations)
+    assert(sum(b.skipped) > 0)
+
+def test_sweep():
+    packed = clustering.np.packbits(clustering.np.array(points, dtype=clustering.np.uint8), axis=1)
+    a = clustering.sweep(packed, 4, [[0, 1], [4, 3]], processes=2)
+    assert(a[0][0] == [0, 1, 1, 0, 0])
+    assert(a[1][0] == [0, 0, 1, 1, 0])
+    assert(a[1][1] == 2)
@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+sys.path.insert(0, './answers')
+import disk_cache
+from state_vectors import StateVectors
+
+def test_disk_cache():
+    path = os.path.join(tempfile.mkdtemp(), "plants.data")
+    with open(path, "w") as f:
+        f.write("abelia,fl,nc\nabies,ak,nc\n")
+    directory = disk_cache.cache_directory(path)
+    assert(directory == path + ".cache")
+    assert(disk_cache.load_vectors(directory, ["fl", "nc"]) is None)
+    v = StateVectors.from_groups(["fl", "nc"], ["abelia", "abies"], {"fl": ["abelia"], "nc": ["abelia", "abies"]})
+    disk_cache.save_vectors(directory, v)
+    a = disk_cache.load_vectors(disk_cache.cache_directory(path), ["fl", "nc"])
+    assert(a.plants == v.plants)
+    assert(a.bits.tolist() == v.bits.tolist())
+    assert(a.distance2("fl", "nc") == 1)
+    assert(disk_cache.load_vectors(directory, ["nc", "fl"]) is None)
+    os.utime(path, ns=(0, 0))
+    assert(disk_cache.load_vectors(disk_cache.cache_directory(path), ["fl", "nc"]) is not None)
+    with open(path, "a") as f:
+        f.write("acer,ak\n")
+    assert(disk_cache.load_vectors(disk_cache.cache_directory(path), ["fl", "nc"]) is None)
@@ -0,0 +1,21 @@
+import sys
+sys.path.insert(0, './answers')
+import all_states
+import encoding
+import itemsets
+
+baskets = [["qc", "on", "pe"], ["on", "ca"], ["ca", "az", "qc"], ["pe", "on"]]
+
+def test_item_encoding():
+    e = encoding.item_encoding(item for basket in baskets for item in basket)
+    assert(len(e) == len(all_states.all_states) + 1)
+    assert(e.names == sorted(e.names))
+    assert(e.decode(e.encode(["qc", "pe", "ab"])) == ["qc", "pe", "ab"])
+    assert(e.decode_rows([([e.ids["on"]], 3, 0.5)]) == [(["on"], 3, 0.5)])
+
+def test_encoded_mining():
+    e = encoding.item_encoding(item for basket in baskets for item in basket)
+    encoded = [e.encode(basket) for basket in baskets]
+    a = e.decode_rows(itemsets.top_interests(itemsets.mine(encoded, 0.25), 5, 0.5, 4))
+    b = itemsets.top_interests(itemsets.mine(baskets, 0.25), 5, 0.5, 4)
+    assert(a == [tuple(row) for row in b])
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+sys.path.insert(0, './answers')
+from answer import frequent_itemsets, association_rules
+from answer import incremental_frequent_itemsets, incremental_association_rules
+
+def test_incremental():
+    lines = open("./data/plants.data", "rb").readlines()
+    path = os.path.join(tempfile.mkdtemp(), "plants.data")
+    with open(path, "wb") as f:
+        f.writelines(lines[:30000])
+    a = incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    assert(a == frequent_itemsets(path, 15, 0.1, 0.3))
+    with open(path, "ab") as f:
+        f.writelines(lines[30000:])
+    a = incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    assert(a == open("tests/frequent_items.txt","r").read())
+    a = incremental_association_rules(path, 15, 0.1, 0.3)
+    assert(a == open("tests/association_rules.txt","r").read())
+
+def test_incremental_partial_line():
+    path = os.path.join(tempfile.mkdtemp(), "baskets.data")
+    with open(path, "wb") as f:
+        f.write(b"a,qc,on\nb,qc")
+    a = incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    assert(a == "['on', 'qc'],1\n['on'],1\n['qc'],1\n".replace("\n", os.linesep))
+    with open(path, "ab") as f:
+        f.write(b",on\nc,qc,on\n")
+    a = incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    assert(a == frequent_itemsets(path, 15, 0.1, 0.3))
+    assert(a.startswith("['on', 'qc'],3"))
+    a = incremental_association_rules(path, 15, 0.1, 0.3)
+    assert(a == association_rules(path, 15, 0.1, 0.3))
+
+def test_incremental_wide_line():
+    lines = open("./data/plants.data", "rb").readlines()
+    path = os.path.join(tempfile.mkdtemp(), "plants.data")
+    with open(path, "wb") as f:
+        f.writelines(lines[:34780])
+    incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    with open(path, "ab") as f:
+        f.write(max(lines, key=lambda line: line.count(b",")))
+    a = incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    assert(a == frequent_itemsets(path, 15, 0.1, 0.3))
+
+def test_incremental_rewrite():
+    path = os.path.join(tempfile.mkdtemp(), "baskets.data")
+    with open(path, "wb") as f:
+        f.write(b"a,qc,on\nb,qc,on\n")
+    incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    with open(path, "wb") as f:
+        f.write(b"a,qc,nb\nb,qc,nb\nc,qc\n")
+    a = incremental_frequent_itemsets(path, 15, 0.1, 0.3)
+    assert(a == frequent_itemsets(path, 15, 0.1, 0.3))
+    assert(a.startswith("['nb', 'qc'],2"))
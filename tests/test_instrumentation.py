@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import tempfile
+sys.path.insert(0, './answers')
+import instrumentation
+from instrumentation import instrumented
+
+@instrumented
+def parse(lines):
+    instrumentation.cache("lines", False)
+    instrumentation.rows(len(lines))
+    return [line.split(",") for line in lines]
+
+@instrumented
+def pipeline(lines):
+    baskets = parse(lines)
+    with instrumentation.stage("count"):
+        instrumentation.cache("lines", True)
+        return sum(len(basket) for basket in baskets)
+
+def test_disabled():
+    instrumentation.disable()
+    instrumentation.last_report = None
+    assert(pipeline(["a,b", "c"]) == 3)
+    assert(instrumentation.report() is None)
+
+def test_report():
+    path = os.path.join(tempfile.mkdtemp(), "stages.log")
+    instrumentation.enable(path)
+    try:
+        assert(pipeline(["a,b", "c"]) == 3)
+        pipeline(["a"])
+    finally:
+        instrumentation.disable()
+    r = instrumentation.report()
+    assert(r["name"] == "pipeline" and r["jobs"] == 0 and r["elapsed"] >= 0)
+    assert([stage["name"] for stage in r["stages"]] == ["parse", "count"])
+    assert(r["stages"][0]["rows"] == 1)
+    assert(r["stages"][0]["caches"] == {"lines": {"hits": 0, "misses": 1}})
+    assert(r["stages"][1]["caches"] == {"lines": {"hits": 1, "misses": 0}})
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert(len(lines) == 2 and lines[1] == r)
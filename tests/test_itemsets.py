@@ -0,0 +1,37 @@
+import sys
+sys.path.insert(0, './answers')
+import itemsets
+
+baskets = [["a", "b", "c"], ["a", "b"], ["b", "c"], ["a", "b", "c", "d"], [], ["d"]]
+
+def test_mine():
+    a = itemsets.mine(baskets, 0.5)
+    assert(a == {frozenset(["a"]): 3, frozenset(["b"]): 4, frozenset(["c"]): 3,
+                 frozenset(["a", "b"]): 3, frozenset(["b", "c"]): 3})
+    assert(itemsets.mine(baskets, 0.3) == itemsets.count_itemsets(baskets, itemsets.mine(baskets, 0.3)))
+
+def test_rules():
+    a = itemsets.mine(baskets, 0.5)
+    assert(itemsets.top_itemsets(a, 3) == [(["a", "b"], 3), (["c", "b"], 3), (["b"], 4)])
+    assert(itemsets.top_rules(a, 10, 0.9) == [(["a"], ["b"], 1.0), (["c"], ["b"], 1.0)])
+    assert(itemsets.top_interests(a, 1, 0.9, 6) == [(["a"], ["b"], 1.0, ["b"], 4, 1 - 4 / 6)])
+
+def test_son():
+    chunks = list(itemsets.chunks(iter(baskets), 4))
+    assert([len(chunk) for chunk in chunks] == [3, 3])
+    candidates = itemsets.son_candidates(chunks, 0.5)
+    assert(set(itemsets.mine(baskets, 0.5)) <= candidates)
+    assert(itemsets.count_tidsets(baskets, candidates) == itemsets.count_itemsets(baskets, candidates))
+
+def test_son_chunk_tail():
+    wide = [str(i) for i in range(30)]
+    chunks = list(itemsets.chunks(iter(baskets[:4] * 2 + [wide]), 4))
+    assert([len(chunk) for chunk in chunks] == [4, 2, 3])
+    assert(len(itemsets.son_candidates(chunks, 0.5)) < 100)
+
+def test_toivonen():
+    frequent = set(itemsets.mine(baskets, 0.5))
+    border = itemsets.negative_border(frequent, "abcd")
+    assert(border == {frozenset("d"), frozenset("ac")})
+    frequent, border = itemsets.toivonen_candidates(baskets[:3], 0.5, "abcd", 0.8)
+    assert(frequent == set(itemsets.mine(baskets, 0.5)) and border == {frozenset("d"), frozenset("ac")})
@@ -0,0 +1,29 @@
+import sys
+sys.path.insert(0, './answers')
+import answer
+from answer import kmeans, first_iter
+
+def test_kmeans_spark():
+    answer.KMEANS_ENGINE = "local"
+    try:
+        local_first = first_iter("./data/plants.data", 3, 123)
+        local = kmeans("./data/plants.data", 10, 123)
+        answer.KMEANS_ENGINE = "spark"
+        assert(first_iter("./data/plants.data", 3, 123) == local_first)
+        assert(kmeans("./data/plants.data", 10, 123) == local)
+    finally:
+        answer.KMEANS_ENGINE = "auto"
+
+def test_plant_count_cached():
+    answer.KMEANS_LOCAL_MAX_CELLS = 0
+    try:
+        first_iter("./data/plants.data", 3, 123)
+        key = answer.dataset_key("./data/plants.data")
+        assert(answer.points_cache[key[0]][0] == key)
+        answer.open = None
+        try:
+            assert(answer.plant_count("./data/plants.data") == answer.points_cache[key[0]][1][1])
+        finally:
+            del answer.open
+    finally:
+        answer.KMEANS_LOCAL_MAX_CELLS = 100000000
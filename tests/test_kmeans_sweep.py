@@ -0,0 +1,10 @@
+import sys
+sys.path.insert(0, './answers')
+from answer import kmeans, kmeans_sweep
+
+def test_kmeans_sweep():
+    a = kmeans_sweep("./data/plants.data", [2, 10], [123, 7070], processes=2)
+    assert(len(a["runs"]) == 4)
+    assert([(run["k"], run["seed"]) for run in a["runs"]] == [(2, 123), (2, 7070), (10, 123), (10, 7070)])
+    assert(a["runs"][2]["classes"] == kmeans("./data/plants.data", 10, 123))
+    assert(a["best"][2]["inertia"] == min(run["inertia"] for run in a["runs"][:2]))
@@ -0,0 +1,30 @@
+import sys
+sys.path.insert(0, './answers')
+import answer
+from answer import load_baskets, invalidate_baskets, init_spark
+from pyspark.sql.functions import max
+
+def test_load_baskets():
+    a = load_baskets("./data/plants.data")
+    assert(a.columns == ["id", "plant", "items"])
+    assert(load_baskets("./data/plants.data") is a)
+    invalidate_baskets("./data/plants.data")
+    b = load_baskets("./data/plants.data")
+    assert(b is not a)
+    assert(b.count() == 34781)
+
+def test_load_baskets_split_file():
+    spark = init_spark()
+    previous = spark.conf.get("spark.sql.files.maxPartitionBytes")
+    answer.DISK_CACHE = False
+    spark.conf.set("spark.sql.files.maxPartitionBytes", 65536)
+    try:
+        invalidate_baskets("./data/plants.data")
+        a = load_baskets("./data/plants.data")
+        assert(a.rdd.getNumPartitions() > 1)
+        assert(a.agg(max("id")).first()[0] == 34780)
+        assert(a.where(a.id == 34780).first().plant == "zygophyllum fabago")
+    finally:
+        spark.conf.set("spark.sql.files.maxPartitionBytes", previous)
+        answer.DISK_CACHE = True
+        invalidate_baskets("./data/plants.data")
@@ -0,0 +1,40 @@
+import sys
+sys.path.insert(0, './answers')
+import answer
+from answer import frequent_itemsets, association_rules, interests
+
+def outputs(engine, s, c):
+    answer.FPM_ENGINE = engine
+    try:
+        return (frequent_itemsets("./data/plants.data", 1000000, s, c),
+                association_rules("./data/plants.data", 1000000, s, c),
+                interests("./data/plants.data", 1000000, s, c))
+    finally:
+        answer.FPM_ENGINE = "auto"
+
+def test_local_fpm():
+    for s, c in [(0.1, 0.3), (0.15, 0.8), (0.2, 0.0)]:
+        assert(outputs("local", s, c) == outputs("spark", s, c))
+
+def test_local_fpm_expected():
+    answer.FPM_ENGINE = "local"
+    try:
+        a = frequent_itemsets("./data/plants.data", 15, 0.1, 0.3)
+        assert(a==open("tests/frequent_items.txt","r").read())
+        a = association_rules("./data/plants.data", 15, 0.1, 0.3)
+        assert(a==open("tests/association_rules.txt","r").read())
+        a = interests("./data/plants.data", 15, 0.1, 0.3)
+        assert(a==open("tests/interests.txt","r").read())
+    finally:
+        answer.FPM_ENGINE = "auto"
+
+def test_son_fpm():
+    sample, chunk = answer.TOIVONEN_SAMPLE, answer.SON_CHUNK_BASKETS
+    answer.SON_CHUNK_BASKETS = 5000
+    try:
+        for toivonen in [None, 0.1]:
+            answer.TOIVONEN_SAMPLE = toivonen
+            answer.local_cache.clear()
+            assert(outputs("son", 0.1, 0.3) == outputs("local", 0.1, 0.3))
+    finally:
+        answer.TOIVONEN_SAMPLE, answer.SON_CHUNK_BASKETS = sample, chunk
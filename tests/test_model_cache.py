@@ -0,0 +1,13 @@
+import sys
+sys.path.insert(0, './answers')
+from answer import fpgrowth_model, model_cache_info, clear_model_cache
+
+def test_model_cache():
+    clear_model_cache()
+    a = fpgrowth_model("./data/plants.data", 0.1, 0.3)
+    b = fpgrowth_model("./data/plants.data", 0.1, 0.3)
+    assert(a is b)
+    info = model_cache_info()
+    assert(info["hits"] == 1)
+    assert(info["misses"] == 1)
+    assert(info["size"] == 1)
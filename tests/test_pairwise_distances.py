@@ -0,0 +1,7 @@
+import sys
+sys.path.insert(0, './answers')
+from answer import pairwise_distances
+
+def test_pairwise_distances():
+    a = pairwise_distances("./data/plants.data", ["qc", "ca"], ["on", "az"])
+    assert(a.tolist() == [[1708, 8334], [12560, 10718]])
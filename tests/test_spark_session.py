@@ -0,0 +1,22 @@
+import sys
+import subprocess
+sys.path.insert(0, './answers')
+from answer import init_spark, spark_context
+
+def test_lazy_import():
+    code = "import answer, pyspark; answer.init_centroids(3, 124); " \
+           "print(answer.spark_session is None and pyspark.SparkContext._active_spark_context is None)"
+    a = subprocess.check_output([sys.executable, "-c", code], cwd="./answers")
+    assert(a.split()[-1] == b"True")
+
+def test_session_reused():
+    assert(init_spark() is init_spark())
+    assert(spark_context() is init_spark().sparkContext)
+
+def test_local_kmeans_without_spark():
+    code = "import answer, pyspark; answer.kmeans('../data/plants.data', 2, 7070); " \
+           "answer.stop_spark(); answer.vectors_cache.clear(); " \
+           "answer.first_iter('../data/plants.data', 3, 123); " \
+           "print(answer.spark_session is None and pyspark.SparkContext._active_spark_context is None)"
+    a = subprocess.check_output([sys.executable, "-c", code], cwd="./answers")
+    assert(a.split()[-1] == b"True")
@@ -0,0 +1,23 @@
+import sys
+sys.path.insert(0, './answers')
+from state_vectors import StateVectors
+
+def test_state_vectors():
+    plants = ["c", "a", "b", "d", "e", "f", "g", "h", "i"]
+    groups = {"qc": ["a", "i"], "on": ["a", "b", "c"]}
+    v = StateVectors.from_groups(["qc", "on", "hi"], plants, groups)
+    assert(v.plants == sorted(plants))
+    assert(v.bits.shape == (3, 2))
+    assert(v.contains("qc", "i"))
+    assert(v.contains("qc", "b") == False)
+    assert(v.contains("hi", "a") == False)
+    assert(v.as_dict("on") == {"a": 1, "b": 1, "c": 1, "d": 0, "e": 0, "f": 0, "g": 0, "h": 0, "i": 0})
+    assert(v.distance2("qc", "on") == 3)
+    assert(v.distance2("hi", "on") == 3)
+
+def test_pairwise_distances():
+    plants = ["a", "b", "c", "d"]
+    groups = {"qc": ["a"], "on": ["a", "b", "c"], "hi": ["d"]}
+    v = StateVectors.from_groups(["qc", "on", "hi"], plants, groups)
+    assert(v.pairwise_distances(["qc", "hi"], ["on", "qc", "hi"]).tolist() == [[2, 0, 2], [4, 2, 0]])
+    assert(v.distance_matrix() is v.distance_matrix())
@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+sys.path.insert(0, './answers')
+import streaming
+from answer import kmeans, save_kmeans_model, stream_kmeans, stream_kmeans_directory
+
+def california_lines(state):
+    lines = open("./data/plants.data", "r", encoding="utf-8", errors="replace").read().splitlines()
+    return [line.split(",")[0] + "," + state for line in lines if "ca" in line.split(",")[1:]]
+
+def moved_with_california(model, changes):
+    return len(changes) == 1 and changes[0][0] == "ak" and \
+           changes[0][2] == model.assignments[model.state_index["ca"]]
+
+def test_stream_kmeans():
+    path = os.path.join(tempfile.mkdtemp(), "model.npz")
+    assert(save_kmeans_model("./data/plants.data", 10, 123, path) == kmeans("./data/plants.data", 10, 123))
+    changes = list(stream_kmeans(path, [california_lines("ak"), ["new plant,ak,zz"]]))
+    model = streaming.StreamingKMeans.load(path)
+    assert(moved_with_california(model, changes[0]) and changes[1] == [])
+    assert(model.plants[-1] == "new plant")
+    assert(model.plant_index["new plant"] in model.members[model.state_index["ak"]])
+
+def test_stream_kmeans_directory():
+    path = os.path.join(tempfile.mkdtemp(), "model.npz")
+    save_kmeans_model("./data/plants.data", 10, 123, path)
+    directory = tempfile.mkdtemp()
+    received = []
+    query = stream_kmeans_directory(path, directory, lambda batch, changes: received.extend(changes))
+    try:
+        staging = os.path.join(tempfile.mkdtemp(), "new.data")
+        with open(staging, "w") as f:
+            f.write("\n".join(california_lines("ak")) + "\n")
+        os.rename(staging, os.path.join(directory, "new.data"))
+        query.processAllAvailable()
+    finally:
+        query.stop()
+    assert(moved_with_california(query.model, received))
+    assert(moved_with_california(streaming.StreamingKMeans.load(path), received))
@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+sys.path.insert(0, './answers')
+import numpy as np
+import clustering
+import streaming
+from state_vectors import StateVectors
+
+def model(groups, assignments, k):
+    vectors = StateVectors.from_groups(sorted(groups), [p for ps in groups.values() for p in ps], groups)
+    return streaming.StreamingKMeans.from_vectors(vectors, assignments, k)
+
+def check_sums(m):
+    sums = np.zeros_like(m.sums)
+    for plant_ids, cluster in zip(m.members, m.assignments):
+        sums[cluster, list(plant_ids)] += 1
+    assert((sums == m.sums).all())
+    assert((m.squares == (sums * sums).sum(axis=1)).all())
+    assert(m.counts.tolist() == np.bincount(m.assignments, minlength=len(m)).tolist())
+
+def test_update():
+    m = model({"a": ["p1", "p2"], "b": ["p1"], "c": ["p3", "p4", "p5", "p6"], "d": ["p4"]},
+              [0, 0, 1, 1], 2)
+    assert(m.update_lines(["p1,d,xx", "p2,d\n", "p2,b"]) == [("d", 1, 0)])
+    assert(m.classes() == [["a", "b", "d"], ["c"]])
+    check_sums(m)
+    assert(m.update_lines(["p7,d", "p1,a"]) == [])
+    assert(m.plants[-1] == "p7")
+    check_sums(m)
+
+def test_random_batches():
+    random = np.random.RandomState(5)
+    points = (random.rand(30, 40) < 0.2).astype(float)
+    result = clustering.lloyd(points, [0, 1, 2, 3])
+    names = ["s%02d" % i for i in range(30)]
+    groups = dict((name, ["p%03d" % j for j in np.flatnonzero(row)]) for name, row in zip(names, points))
+    m = model(groups, result.assignments, 4)
+    check_sums(m)
+    for batch in range(20):
+        lines = ["p%03d,%s" % (random.randint(60), names[random.randint(30)]) for i in range(5)]
+        touched = set(line.split(",")[1] for line in lines)
+        m.update_lines(lines)
+        check_sums(m)
+        for state in touched:
+            row = m.state_index[state]
+            x = np.zeros(m.sums.shape[1])
+            x[list(m.members[row])] = 1
+            means = m.sums / np.maximum(m.counts, 1)[:, None]
+            distances = ((means - x) ** 2).sum(axis=1)
+            distances[m.counts == 0] = np.inf
+            assert(distances[m.assignments[row]] <= distances.min() + 1e-9)
+
+def test_save_load():
+    m = model({"a": ["p1", "p2"], "b": ["p1"], "c": ["p3"]}, [0, 0, 1], 2)
+    m.update_lines(["p9,c"])
+    path = os.path.join(tempfile.mkdtemp(), "model.npz")
+    m.save(path)
+    n = streaming.StreamingKMeans.load(path)
+    assert(n.plants == m.plants and n.states == m.states and n.members == m.members)
+    assert((n.sums[:, :len(n.plants)] == m.sums[:, :len(m.plants)]).all())
+    assert(n.assignments.tolist() == m.assignments.tolist())
@@ -0,0 +1,10 @@
+import sys
+sys.path.insert(0, './answers')
+from answer import init_spark, top_n, toCSVLine
+
+def test_top_n():
+    spark = init_spark()
+    df = spark.createDataFrame([(1, "b"), (3, "a"), (2, "c"), (3, "b"), (1, "a")], ["x", "y"])
+    a = top_n(df, 3, ["x"], [False])
+    assert([tuple(row) for row in a] == [(3, "a"), (3, "b"), (2, "c")])
+    assert(toCSVLine(a) == "3,a\n3,b\n2,c\n")
@@ -0,0 +1,11 @@
+import io
+import sys
+sys.path.insert(0, './answers')
+from answer import load_baskets, toCSVLine, toCSVLineIterator, writeCSV
+
+def test_write_csv():
+    df = load_baskets("./data/plants.data").orderBy("id").limit(11)
+    out = io.StringIO()
+    assert(writeCSV(df, out) == 11)
+    assert(out.getvalue() == open("tests/data_frame.txt","r").read())
+    assert("".join(toCSVLineIterator(df)) == toCSVLine(df))